@@ -0,0 +1,248 @@
+"""Benchmark suite of the simulations
+
+Measures the step throughput of ForagingModel over a grid of (engine, width, height, R, P, F),
+the iterative Lotka-Volterra simulation and the Moran process of foraging/moran_process.py.
+Results are saved as JSON and compared against a stored baseline : a case slower than the baseline
+by more than the tolerance, or a step cost growing faster than linearly with the number of agents
+(quadratic scans), is reported as a regression and the script exits with status 1.
+
+    python benchmarks/benchmark.py                      #run and compare with benchmarks/baseline.json
+    python benchmarks/benchmark.py --save-baseline      #store the results as the new baseline
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "foraging"))
+sys.path.insert(0, os.path.join(ROOT, "lotka_volterra"))
+
+#(engine, width, height, R, P, F), populations grow with the area of the map
+FORAGING_CASES = [
+    ("agents", 10, 10, 10, 50, 3),
+    ("agents", 20, 20, 40, 200, 10),
+    ("agents", 30, 30, 90, 450, 20),
+    ("vectorized", 100, 100, 1000, 5000, 200),
+    ("vectorized", 200, 200, 4000, 20000, 800),
+    ("vectorized", 400, 400, 16000, 80000, 3200),
+]
+LOTKA_VOLTERRA_STEPS = [200, 2000]
+#Step cost growing as agents^exponent with an exponent above this is flagged
+MAX_SCALING_EXPONENT = 1.5
+
+
+def peak_memory(function):
+    """Peak memory allocated by Python while running function, in MB
+    """
+    tracemalloc.start()
+    try :
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally :
+        tracemalloc.stop()
+    return peak/2**20
+
+
+def bench_foraging(engine:str, width:int, height:int, R:int, P:int, F:int, steps:int):
+    """Time ForagingModel.step
+
+    Returns:
+        dict: steps/s, agents/s (agent steps processed per second), mean number of agents, peak memory
+            of the same run (tracemalloc slows it down too much to be timed at the same time)
+    """
+    from model import ForagingModel
+
+    def run():
+        #Same seed on every call, the memory is measured on a replay of the timed run
+        model = ForagingModel(R, P, F, width, height, engine = engine, seed = 0, silent = True)
+        agents = 0
+        for i in range(steps):
+            agents += model.schedule.get_agent_count()
+            model.step()
+        return agents
+
+    start = time.perf_counter()
+    agents = run()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "steps_per_s": steps/elapsed,
+        "agents_per_s": agents/elapsed,
+        "mean_agents": agents/steps,
+        "peak_memory_mb": peak_memory(run),
+        }
+
+
+def bench_lotka_volterra(steps:int):
+    """Time the iterative update of lotka_volterra simple_simulation, with its default parameters
+
+    Returns:
+        dict: steps/s, peak memory
+    """
+    from lk_refacto import simple_simulation
+    import inspect
+
+    defaults = inspect.signature(simple_simulation.run).parameters
+    species_parameters = defaults["species_parameters"].default
+    species_effects = defaults["species_effects"].default
+    sim = simple_simulation()
+
+    def run():
+        #Parameters are compiled once, as in simple_simulation.run
+        sim.iterative_run(sim.compile(species_parameters, species_effects), steps)
+
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    return {"steps_per_s": steps/elapsed, "peak_memory_mb": peak_memory(run)}
+
+
+def bench_moran():
+    """Time one Moran process with the players of foraging/moran_process.py
+
+    Returns:
+        dict: generations/s, peak memory, or None if axelrod is not installed
+    """
+    try :
+        import axelrod as axl
+    except ImportError:
+        return None
+
+    def players():
+        return [axl.Alternator(), axl.TitForTat(), axl.Grudger(), axl.Cooperator(), axl.Cooperator(), axl.Cooperator(),
+                axl.TitForTat(), axl.TitForTat(), axl.TitForTat(), axl.Random()]
+
+    start = time.perf_counter()
+    generations = len(axl.MoranProcess(players(), seed = 14).play())
+    elapsed = time.perf_counter() - start
+    memory = peak_memory(lambda: axl.MoranProcess(players(), seed = 14).play())
+    return {"generations_per_s": generations/elapsed, "peak_memory_mb": memory}
+
+
+def run_suite(steps:int = 30):
+    """Run every benchmark
+
+    Args:
+        steps (int, optional): steps of each ForagingModel case. Defaults to 30.
+
+    Returns:
+        dict: results by case name
+    """
+    results = {}
+    for engine, width, height, R, P, F in FORAGING_CASES:
+        name = "foraging-{}-{}x{}-R{}-P{}-F{}".format(engine, width, height, R, P, F)
+        results[name] = bench_foraging(engine, width, height, R, P, F, steps)
+        print("{:<55} {:>10.1f} steps/s {:>12.0f} agents/s {:>8.1f} MB".format(
+            name, results[name]["steps_per_s"], results[name]["agents_per_s"], results[name]["peak_memory_mb"]))
+    for steps in LOTKA_VOLTERRA_STEPS:
+        name = "lotka-volterra-{}".format(steps)
+        results[name] = bench_lotka_volterra(steps)
+        print("{:<55} {:>10.1f} steps/s".format(name, results[name]["steps_per_s"]))
+    moran = bench_moran()
+    if moran is None:
+        print("moran : axelrod not installed, skipped")
+    else :
+        results["moran"] = moran
+        print("{:<55} {:>10.1f} generations/s".format("moran", moran["generations_per_s"]))
+    return results
+
+
+def scaling_exponents(results:dict):
+    """Exponent of the step cost against the number of agents, by engine, from a log-log fit
+
+    Returns:
+        dict: engine:exponent, 1 is linear, 2 quadratic
+    """
+    exponents = {}
+    for engine in sorted({case[0] for case in FORAGING_CASES}):
+        cases = [value for name, value in results.items() if name.startswith("foraging-{}-".format(engine))]
+        if len(cases) < 2:
+            continue
+        agents = np.log([case["mean_agents"] for case in cases])
+        cost = np.log([1/case["steps_per_s"] for case in cases])
+        exponents[engine] = float(np.polyfit(agents, cost, 1)[0])
+    return exponents
+
+
+def compare(results:dict, baseline:dict, tolerance:float):
+    """List the regressions of results against a baseline
+
+    Args:
+        results (dict): results of run_suite
+        baseline (dict): stored results of run_suite
+        tolerance (float): allowed relative slowdown, 0.3 for 30%
+
+    Returns:
+        list: description of each regression
+    """
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        for metric in ("steps_per_s", "generations_per_s"):
+            if metric in value and value[metric] < baseline[name][metric]*(1 - tolerance):
+                regressions.append("{} : {} {:.1f}, baseline {:.1f}".format(name, metric, value[metric], baseline[name][metric]))
+    for engine, exponent in scaling_exponents(results).items():
+        if exponent > MAX_SCALING_EXPONENT:
+            regressions.append("{} engine : step cost grows as agents^{:.2f}".format(engine, exponent))
+    return regressions
+
+
+def git_commit():
+    """Commit the benchmarks are run at, to tell how old a stored baseline is
+
+    Returns:
+        str: short hash, with a "+" if the tree has uncommitted changes, or None outside of a git repository
+    """
+    try :
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = ROOT, capture_output = True,
+                text = True, check = True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD", "--", "foraging", "lotka_volterra", "benchmarks",
+                ":(exclude)foraging/logs", ":(exclude)benchmarks/baseline.json"],
+                cwd = ROOT).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if dirty else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the simulations")
+    parser.add_argument("--steps", type = int, default = 30, help = "steps of each ForagingModel case")
+    parser.add_argument("--output", default = "benchmark_results.json", help = "JSON file of the results")
+    parser.add_argument("--baseline", default = os.path.join(ROOT, "benchmarks", "baseline.json"))
+    parser.add_argument("--tolerance", type = float, default = 0.3, help = "allowed relative slowdown")
+    parser.add_argument("--save-baseline", action = "store_true", help = "store the results as the baseline")
+    args = parser.parse_args()
+
+    results = run_suite(args.steps)
+    for engine, exponent in scaling_exponents(results).items():
+        print("{} engine : step cost ~ agents^{:.2f}".format(engine, exponent))
+    report = {"machine": platform.platform(), "python": platform.python_version(), "commit": git_commit(),
+            "results": results}
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent = 2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(report, output, indent = 2)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, run with --save-baseline first".format(args.baseline))
+        return 0
+    with open(args.baseline) as stored:
+        baseline = json.load(stored)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
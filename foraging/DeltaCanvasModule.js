@@ -0,0 +1,86 @@
+/**
+Canvas grid of DeltaCanvasGrid (model_viz.py)
+====================================================================
+
+The terrain is drawn once, on a background canvas, from the first frame of a model :
+{"full": true, "terrain": {"palette": [portrayal, ...], "cells": [palette index by cell x*height + y, -1 for nothing]}, ...}
+
+Every frame then only carries the objects that appeared, moved or changed, and the ones that disappeared :
+{"full": false, "styles": [new portrayals], "set": {key: [x, y, style index]}, "removed": [key, ...]}
+
+The browser keeps the objects between frames, and redraws them over a copy of the background.
+*/
+
+var DeltaCanvasModule = function(canvas_width, canvas_height, grid_width, grid_height) {
+	// Create the element
+	// ------------------
+	var canvas_tag = `<canvas width="${canvas_width}" height="${canvas_height}" class="world-grid"/>`
+	var parent_div_tag = '<div style="height:' + canvas_height + 'px;" class="world-grid-parent"></div>'
+
+	var canvas = $(canvas_tag)[0];
+	var parent = $(parent_div_tag)[0];
+	$("#elements").append(parent);
+	parent.append(canvas);
+
+	var context = canvas.getContext("2d");
+	var canvasDraw = new GridVisualization(canvas_width, canvas_height, grid_width, grid_height, context, null);
+
+	// Terrain, never redrawn
+	var background = document.createElement("canvas");
+	background.width = canvas_width;
+	background.height = canvas_height;
+	var backgroundDraw = new GridVisualization(canvas_width, canvas_height, grid_width, grid_height, background.getContext("2d"), null);
+
+	// Portrayals without position, and [x, y, style] of the objects on the grid, by key
+	var styles = [];
+	var objects = {};
+
+	var drawTerrain = function(terrain) {
+		backgroundDraw.resetCanvas();
+		var layer = [];
+		for (var cell = 0; cell < terrain.cells.length; cell++) {
+			if (terrain.cells[cell] < 0)
+				continue;
+			var portrayal = Object.assign({}, terrain.palette[terrain.cells[cell]]);
+			portrayal.x = Math.floor(cell / grid_height);
+			portrayal.y = cell % grid_height;
+			layer.push(portrayal);
+		}
+		backgroundDraw.drawLayer(layer);
+	};
+
+	this.render = function(data) {
+		if (data.full) {
+			styles = [];
+			objects = {};
+			drawTerrain(data.terrain);
+		}
+		styles = styles.concat(data.styles);
+		for (var i = 0; i < data.removed.length; i++)
+			delete objects[data.removed[i]];
+		for (var key in data.set)
+			objects[key] = data.set[key];
+
+		// drawLayer changes the portrayals it draws, they are copied from the styles
+		var layers = {};
+		for (var key in objects) {
+			var object = objects[key];
+			var portrayal = Object.assign({}, styles[object[2]]);
+			portrayal.x = object[0];
+			portrayal.y = object[1];
+			(layers[portrayal.Layer] = layers[portrayal.Layer] || []).push(portrayal);
+		}
+		canvasDraw.resetCanvas();
+		context.drawImage(background, 0, 0);
+		Object.keys(layers).sort(function(a, b) { return a - b; }).forEach(function(layer) {
+			canvasDraw.drawLayer(layers[layer]);
+		});
+		canvasDraw.drawGridLines("#eee");
+	};
+
+	this.reset = function() {
+		canvasDraw.resetCanvas();
+		styles = [];
+		objects = {};
+	};
+};
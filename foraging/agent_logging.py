@@ -0,0 +1,154 @@
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import multiprocessing
+from multiprocessing.util import Finalize
+import os
+import queue
+
+#Logger name and log file of each species
+LOGGERS = {
+    "rabbits": ("rabbits_logger", "rabbits_agents.log"),
+    "plants": ("plants_logger", "plants_agents.log"),
+    "foxes": ("fox_logger", "fox_agents.log"),
+    "model": ("model_logger", "model.log"),
+}
+
+#Background writer, started once per process, and the process it was started in
+_listener = None
+_listener_pid = None
+_queue_handlers = {}
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler leaving the formatting of records to the writer thread
+    """
+    def prepare(self, record):
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through a fixed fraction of the records, one every 1/rate, without drawing random numbers
+    (the simulation random streams must not depend on logging)
+    """
+    def __init__(self, rate:float = 1):
+        super().__init__()
+        self.rate = rate
+        self._credit = 0
+
+    def filter(self, record):
+        self._credit += self.rate
+        if self._credit >= 1:
+            self._credit -= 1
+            return True
+        return False
+
+
+class ModelLogger:
+    """Logger of one species for one model : the level, sampling and silent flag of a model only apply
+    to its own records, which then go to the shared logger of the species and its handlers
+    """
+    def __init__(self, logger, level:int = logging.INFO, rate:float = 1, silent:bool = False):
+        """Initialize the logger
+
+        Args:
+            logger (logging.Logger): shared logger of the species
+            level (int, optional): records below this level are dropped. Defaults to logging.INFO.
+            rate (float, optional): fraction of the records kept. Defaults to 1.
+            silent (bool, optional): drop every record, they're never created nor formatted. Defaults to False.
+        """
+        self.logger = logger
+        self.level = level
+        self.disabled = silent
+        self.sampler = SamplingFilter(rate)
+
+    def isEnabledFor(self, level:int):
+        return not self.disabled and level >= self.level
+
+    def log(self, level:int, msg, *args, **kwargs):
+        if self.isEnabledFor(level) and self.sampler.filter(None):
+            kwargs.setdefault("stacklevel", 2)
+            self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, stacklevel = 3, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, stacklevel = 3, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, stacklevel = 3, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, stacklevel = 3, **kwargs)
+
+
+def setup_logging(levels:dict = None, sampling:dict = None, silent:bool = False, log_dir:str = "logs"):
+    """Loggers of the agents of one model. Handlers of the shared species loggers are installed only
+    the first time : models created in a loop or a batch don't duplicate outputs, and the levels,
+    sampling and silent flag of each model only apply to its own ModelLogger, not to the other models.
+    Records go through a queue to a background thread, which formats and writes them to the
+    terminal and to one file per species. A process forked after the setup (a batch worker) inherits
+    the loggers but not the thread, its handlers are installed again on its first call. Worker processes
+    write to their own files, suffixed with their pid, instead of truncating the files of the main process
+
+    Args:
+        levels (dict, optional): logging level by species ("rabbits", "plants", "foxes", "model"). Defaults to INFO.
+        sampling (dict, optional): fraction of the records kept by species, between 0 and 1. Defaults to 1.
+        silent (bool, optional): disable all the loggers, records are never created nor formatted. Defaults to False.
+        log_dir (str, optional): folder of the log files. Defaults to "logs".
+
+    Returns:
+        dict: species:ModelLogger of the model
+
+    Raises:
+        ValueError: Error if a species doesn't exist or a sampling rate is out of bounds
+    """
+    global _listener, _listener_pid
+    levels = levels or {}
+    sampling = sampling or {}
+    for species in list(levels) + list(sampling):
+        if species not in LOGGERS:
+            raise ValueError("No logger for {}, must be one of {}".format(species, list(LOGGERS)))
+    for species, rate in sampling.items():
+        if not 0 <= rate <= 1:
+            raise ValueError("Sampling rate of {} must be between 0 and 1".format(species))
+
+    if _listener is None or _listener_pid != os.getpid():
+        formatter = logging.Formatter('%(asctime)s : %(message)s')
+        log_queue = queue.SimpleQueue()
+        handlers = []
+        worker = multiprocessing.parent_process() is not None
+        for species, (logger_name, log_file) in LOGGERS.items():
+            if worker:
+                name, extension = os.path.splitext(log_file)
+                log_file = "{}.{}{}".format(name, os.getpid(), extension)
+            file_handler = logging.FileHandler(os.path.join(log_dir, log_file), mode='w', delay=True)
+            file_handler.setFormatter(formatter)
+            file_handler.addFilter(logging.Filter(logger_name))
+            handlers.append(file_handler)
+
+            logger = logging.getLogger(logger_name)
+            #Handler of the queue of the parent process, its records would never be written
+            if species in _queue_handlers:
+                logger.removeHandler(_queue_handlers[species])
+            queue_handler = _queue_handlers[species] = DeferredQueueHandler(log_queue)
+            logger.addHandler(queue_handler)
+            logger.propagate = False
+            #Levels are checked by the loggers of each model
+            logger.setLevel(logging.DEBUG)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+
+        _listener = QueueListener(log_queue, *handlers)
+        _listener_pid = os.getpid()
+        _listener.start()
+        if worker:
+            #multiprocessing workers leave without running atexit
+            Finalize(_listener, _listener.stop, exitpriority=10)
+        else :
+            atexit.register(_listener.stop)
+
+    return {species: ModelLogger(logging.getLogger(logger_name), levels.get(species, logging.INFO),
+            sampling.get(species, 1), silent) for species, (logger_name, log_file) in LOGGERS.items()}
@@ -8,11 +8,12 @@ from mesa.datacollection import DataCollector
 #batches of multiple models -> run the model multiple time
 from mesa.batchrunner import BatchRunner
 
-import random
 import matplotlib.pyplot as plt
 import numpy as np
 import logging
 
+from space import BLOCKED, DOWNHILL
+
 
 class Plant(Agent):
     
@@ -38,7 +39,8 @@ class Plant(Agent):
         self.grow_time = grow_time
         #initial size
         self.size = 0
-        self.eatable = False
+        #Not through the setter : the grid index reads it when the plant is placed
+        self._eatable = False
         if reprod_rate < 1 and reprod_rate >=0:
             self.reprod_rate = reprod_rate
         else :
@@ -46,6 +48,19 @@ class Plant(Agent):
 
 
         self.logger = logger
+        if model.timer is not None:
+            model.timer.instrument(self, ["grow", "cuttings"])
+
+    @property
+    def eatable(self):
+        return self._eatable
+
+    @eatable.setter
+    def eatable(self, value:bool):
+        #Keeps the count of eatable plants of the grid index up to date
+        if self.pos is not None:
+            self.model.grid.set_eatable(self, value)
+        self._eatable = value
 
     def step(self):
         """Actions take by a plant every step (grow, and try to reproduce asexually)
@@ -65,7 +80,8 @@ class Plant(Agent):
         if self.size < self.grow_time:
             self.size+=1
         elif self.size == self.grow_time:
-            self.eatable = True
+            if not self.eatable:
+                self.eatable = True
         else : 
             raise ValueError("Plant size bigger than max size")
 
@@ -77,27 +93,19 @@ class Plant(Agent):
             - Depending on the terrain, a plant might or might not manage to grow
         """
 
-        match = random.random()
+        match = self.model.draws.reproduction.random()
         if self.reprod_rate > match:
             #Where does the cutting falls
-            proximity = self.model.grid.get_neighborhood(
-                self.pos,
-                moore=True,
-                include_center=True
-                )
-            dispersion = self.random.choice(proximity)
+            dispersion = self.model.grid.random_neighbour(self.pos, self.model.draws.move, include_center=True)
 
             #Competition from other plants
-            neighbours = self.model.grid.get_cell_list_contents([dispersion])
-            conditions = [obj for obj in neighbours if isinstance(obj, Terrain)]
-            neighbours = [obj for obj in neighbours if isinstance(obj, Plant)]
-            print(conditions)
-            competition_factor = 1-(1/float(len(neighbours)+1)) #0 if no plants present, 0.5 for 1, 0.66 for 2,...
-
-            seed_resistance = random.random()
-            if seed_resistance > competition_factor and conditions[0].altitude > 0 :
+            neighbours = self.model.grid.count_species(dispersion, Plant)
+            competition_factor = 1-(1/float(neighbours+1)) #0 if no plants present, 0.5 for 1, 0.66 for 2,...
+
+            seed_resistance = self.model.draws.seed.random()
+            if seed_resistance > competition_factor and self.model.get_altitude(dispersion) > 0 :
             #if seed_resistance > competition_factor :
-                new_id, all_ids = self.model.get_next_id() 
+                new_id = self.model.next_id()
                 a = Plant(new_id, self.model, self.logger, reprod_rate = self.model.p_reprod_rate)
                 self.model.grid.place_agent(a, dispersion)
                 self.model.schedule.add(a)
@@ -121,7 +129,8 @@ class Rabbit(Agent):
         """ 
         super().__init__(unique_id, model)
         self.carrot = 5
-        self.health = max_health
+        #Not through the setter : the registry reads the health when the rabbit is scheduled
+        self._health = max_health
         
         self.unique_id = unique_id
         self.sex = sex
@@ -131,6 +140,18 @@ class Rabbit(Agent):
             raise ValueError("Rabbits reproduction rate must be between 0 and 1")
 
         self.logger = logger
+        if model.timer is not None:
+            model.timer.instrument(self, ["extract_carrot", "sexual_reprod", "feed", "give_carrot", "move", "dies"])
+
+    @property
+    def health(self):
+        return self._health
+
+    @health.setter
+    def health(self, value:int):
+        #Keeps the running health sum of the model registry up to date
+        self.model.registry.update_health(self, value - self._health)
+        self._health = value
 
     def step(self):
         """Actions performed by rabbits every step
@@ -143,72 +164,49 @@ class Rabbit(Agent):
         
         """
         
-        #Agents on the same cell #shoud be move avec self.move()
-        cellmates = self.model.grid.get_cell_list_contents([self.pos])
         #extracting carrot
-        self.extract_carrot(cellmates)
+        self.extract_carrot()
         #reproduce if possible
-        self.sexual_reprod(cellmates)
+        self.sexual_reprod()
         #eat
         self.feed()
         #Moving
-        self.move(cellmates)
+        self.move()
         #Dies if not eating enough
         self.dies()
 
     def dies(self):
         # Kill the rabbit if he spend a few days without carrots
-        if self.health == 0:
+        if self.health <= 0:
             self.model.grid.remove_agent(self)
             self.model.schedule.remove(self)
-            self.logger.info("Rabbit {} is dead :'(".format(self.unique_id))
+            self.logger.info("Rabbit %s is dead :'(", self.unique_id)
     
 
 
-    def move(self, cellmates):
+    def move(self):
         """
-        Makes the rabbit moves to a neighbouring cell
+        Makes the rabbit moves to a neighbouring cell. The kind of move comes from the transition
+        table of the map : water is never entered, and a downhill move gives bonus actions
         """
-        possible_steps = self.model.grid.get_neighborhood(
-            self.pos,
-            moore=True,
-            include_center=False
-        )
-        new_position = self.random.choice(possible_steps)
-        terrain_to_move = [agent for agent in self.model.schedule.agents if agent.pos == new_position and isinstance(agent, Terrain)]
-        future_altitude = terrain_to_move[0].altitude
-        current_altitude = [agent for agent in self.model.schedule.agents if agent.pos == new_position and isinstance(agent, Terrain)][0].altitude
-        if future_altitude<0:
-            pass
-        elif future_altitude<current_altitude:
-            self.model.grid.move_agent(self, new_position)
-            #extracting carrot
-            self.extract_carrot(cellmates)
-            #reproduce if possible
-            self.sexual_reprod(cellmates)
-            #eat
-            self.feed()
-        elif future_altitude<current_altitude/2:
-            self.model.grid.move_agent(self, new_position)
+        new_position, transition = self.model.random_move(self.pos, self.model.draws.move)
+        if transition == BLOCKED:
+            return
+        self.model.grid.move_agent(self, new_position)
+        if transition == DOWNHILL:
             #extracting carrot
-            self.extract_carrot(cellmates)
+            self.extract_carrot()
             #reproduce if possible
-            self.sexual_reprod(cellmates)
+            self.sexual_reprod()
             #eat
             self.feed()
-            #Moving
-            self.move(cellmates)
-        elif future_altitude>=current_altitude:
-            self.model.grid.move_agent(self, new_position)
-        else :
-            raise ValueError("Weird thing going on when going from {} to {}".format(current_altitude, future_altitude))
         
     
     def feed(self):
         """The rabbit will tries to eat a carrot. If he can't eat, the counter will decrease until he starves
         """
         if self.carrot == 0:
-            self.logger.info("Rabbit {} ate all the carrots...".format(self.unique_id))
+            self.logger.info("Rabbit %s ate all the carrots...", self.unique_id)
             self.health -= 1
             
 
@@ -216,7 +214,7 @@ class Rabbit(Agent):
             self.carrot -= 1
             self.health = 5
             #self.logger.info("Rabbit {} eats a carrot!!".format(self.unique_id))
-            self.logger.info("Rabbit {} eats a carrot!!".format(self.unique_id))
+            self.logger.info("Rabbit %s eats a carrot!!", self.unique_id)
         
         else :
             self.give_carrot()
@@ -225,49 +223,51 @@ class Rabbit(Agent):
         """A rabbit can try to give another rabbit a carrot
         """
         #Rabbits in the same location
-        cellmates = self.model.grid.get_cell_list_contents([self.pos])
-        cellmates = [obj for obj in cellmates if isinstance(obj, Rabbit)] #Don't give carrot to plants
+        cellmates = self.model.grid.get_species(self.pos, Rabbit) #Don't give carrot to plants
         if len(cellmates) > 1:
-            other = self.random.choice(cellmates)
+            other = self.model.draws.choice.choice(cellmates)
             other.carrot += 1
             self.carrot -= 1
-            self.logger.info("Rabbit {} is giving a carrot to rabbit {}!!".format(self.unique_id, other.unique_id))
+            self.logger.info("Rabbit %s is giving a carrot to rabbit %s!!", self.unique_id, other.unique_id)
 
-    def extract_carrot(self, cellmates):
+    def extract_carrot(self):
         """A rabbit can look for plants where he is, and make them into carrots
-
-        Args:
-            cellmates (list): List of object in the same position as the rabbit instance
         """
-        plants_material = [obj for obj in cellmates if isinstance(obj, Plant)] #Don't make carrots from rabbits!!
-        plants_material = [plant for plant in plants_material if plant.eatable == True] #carrot must be ready
+        if self.model.plant_layer is not None:
+            #Plants are not agents, eat from the eatable plants of the cell
+            if self.model.plant_layer.consume(self.pos, self.unique_id):
+                self.logger.info("Rabbit %s has found a carrot!!!!!", self.unique_id)
+                self.carrot += 1
+            return
+        #Don't make carrots from rabbits!! carrot must be ready
+        plants_material = self.model.grid.get_eatable(self.pos, Plant)
         if len(plants_material) >= 1:
-            other = self.random.choice(plants_material)
+            other = self.model.draws.choice.choice(plants_material)
             self.model.grid.remove_agent(other)
             self.model.schedule.remove(other)
-            self.logger.info("Rabbit {} has found a carrot!!!!!".format(self.unique_id))
+            self.logger.info("Rabbit %s has found a carrot!!!!!", self.unique_id)
             self.carrot += 1
-            self.logger.info("Rabbit {} is giving a carrot to rabbit {}!!".format(self.unique_id, other.unique_id))
+            self.logger.info("Rabbit %s is giving a carrot to rabbit %s!!", self.unique_id, other.unique_id)
 
-    def sexual_reprod(self, cellmates):
+    def sexual_reprod(self):
         """A rabbit can try to reproduce if an opposite-sex rabbit is on the same case as him
-        Args:
-            cellmates (list): List of object in the same position as the rabbit instance
         """
-        #Rabbits in the same location
-        cellmates = [obj for obj in cellmates if isinstance(obj, Rabbit)] #Look for partners
+        #No partner at all, no need to look at the rabbits in the same location
+        if not self.model.grid.count_sex(self.pos, Rabbit, not self.sex):
+            return
+        cellmates = self.model.grid.get_species(self.pos, Rabbit) #Look for partners
         if cellmates:
             for cellmate in cellmates:
                 if cellmate.sex != self.sex:
-                    match = random.random()
+                    match = self.model.draws.reproduction.random()
                     if self.reprod_rate > match:
-                        sex = bool(random.getrandbits(1))
-                        new_id, all_ids = self.model.get_next_id() 
+                        sex = self.model.draws.sex.random() < 0.5
+                        new_id = self.model.next_id()
                         a = Rabbit(new_id, self.model, sex, self.logger, 
                                 reprod_rate = self.model.r_reprod_rate, max_health = self.model.r_max_health)
                         self.model.grid.place_agent(a, self.pos)
                         self.model.schedule.add(a)
-                        self.logger.info("HO WAW!! Rabbit {} and {} made baby {}!!".format(self.unique_id, cellmate.unique_id, a.unique_id))
+                        self.logger.info("HO WAW!! Rabbit %s and %s made baby %s!!", self.unique_id, cellmate.unique_id, a.unique_id)
                 break #Only reproducing with on rabbit per turn 
             
 class Fox(Agent):
@@ -287,7 +287,8 @@ class Fox(Agent):
         """
         super().__init__(unique_id, model)
         self.max_health = max_health
-        self.health = self.max_health
+        #Not through the setter : the registry reads the health when the fox is scheduled
+        self._health = self.max_health
         self.eaten = False
         
         self.unique_id = unique_id
@@ -298,6 +299,18 @@ class Fox(Agent):
             raise ValueError("Foxes reproduction rate must be between 0 and 1")
 
         self.logger = logger
+        if model.timer is not None:
+            model.timer.instrument(self, ["sexual_reprod", "feed", "move", "death"])
+
+    @property
+    def health(self):
+        return self._health
+
+    @health.setter
+    def health(self, value:int):
+        #Keeps the running health sum of the model registry up to date
+        self.model.registry.update_health(self, value - self._health)
+        self._health = value
 
     def step(self):
         """Actions taken by a fox each step
@@ -306,55 +319,32 @@ class Fox(Agent):
             - Tries to eat a rabbit
         """
         
-        #Agents on the same cell
-        cellmates = self.model.grid.get_cell_list_contents([self.pos])
         #reproduce if possible
-        self.sexual_reprod(cellmates)
+        self.sexual_reprod()
         #eating rabbits
-        self.feed(cellmates)
+        self.feed()
         #Moving
-        self.move(cellmates)
+        self.move()
         #Check if alive
         self.death()
         
 
-    def move(self, cellmates):
+    def move(self):
         """
-        Makes the fox moves to a neighbouring cell
+        Makes the fox moves to a neighbouring cell, see the method in rabbit class
         """
-
-        possible_steps = self.model.grid.get_neighborhood(
-            self.pos,
-            moore=True,
-            include_center=False
-        )
-        new_position = self.random.choice(possible_steps)
-        terrain_to_move = [agent for agent in self.model.schedule.agents if agent.pos == new_position and isinstance(agent, Terrain)]
-        future_altitude = terrain_to_move[0].altitude
-        current_altitude = [agent for agent in self.model.schedule.agents if agent.pos == new_position and isinstance(agent, Terrain)][0].altitude
-        if future_altitude<0:
-            pass
-        elif future_altitude<current_altitude:
-            self.model.grid.move_agent(self, new_position)
-            #reproduce if possible
-            self.sexual_reprod(cellmates)
-            #eating rabbits
-            self.feed(cellmates)
-        elif future_altitude<current_altitude/2:
-            self.model.grid.move_agent(self, new_position)
+        new_position, transition = self.model.random_move(self.pos, self.model.draws.move)
+        if transition == BLOCKED:
+            return
+        self.model.grid.move_agent(self, new_position)
+        if transition == DOWNHILL:
             #reproduce if possible
-            self.sexual_reprod(cellmates)
+            self.sexual_reprod()
             #eating rabbits
-            self.feed(cellmates)
-            #Moving
-            self.move(cellmates)
-        elif future_altitude>=current_altitude:
-            self.model.grid.move_agent(self, new_position)
-        else :
-            raise ValueError("Weird thing going on when going from {} to {}".format(current_altitude, future_altitude))
+            self.feed()
         
     
-    def feed(self, cellmates):
+    def feed(self):
         """
         Tries to eat a rabbit
         """ 
@@ -366,9 +356,9 @@ class Fox(Agent):
             eaten = self.eat_rabbit
         """ 
         #self.logger.info("{} has eaten {}".format(self.unique_id, eaten))
-        rabbit_food = [obj for obj in cellmates if isinstance(obj, Rabbit)] #Don't make carrots from rabbits!!
+        rabbit_food = self.model.grid.get_species(self.pos, Rabbit) #Don't make carrots from rabbits!!
         if len(rabbit_food) >= 1:
-            other = self.random.choice(rabbit_food)
+            other = self.model.draws.choice.choice(rabbit_food)
             self.model.grid.remove_agent(other)
             self.model.schedule.remove(other)
             self.eaten = True
@@ -393,26 +383,28 @@ class Fox(Agent):
             None
         """
         # Kill the fox if he spend a few days without carrots
-        if self.health == 0:
+        if self.health <= 0:
             self.model.grid.remove_agent(self)
             self.model.schedule.remove(self)
             #self.logger.info("Fox {} is dead :'(".format(self.unique_id))
-            self.logger.info("Fox {} is dead :'(".format(self.unique_id))
+            self.logger.info("Fox %s is dead :'(", self.unique_id)
         
 
-    def sexual_reprod(self, cellmates):
+    def sexual_reprod(self):
         """
         Tries to reproduce. See the method in rabbit class
         """
+        if not self.model.grid.count_sex(self.pos, Fox, not self.sex):
+            return
         #Foxes in the same location
-        cellmates = [obj for obj in cellmates if isinstance(obj, Fox)]
+        cellmates = self.model.grid.get_species(self.pos, Fox)
         if cellmates:
             for cellmate in cellmates:
                 if cellmate.sex != self.sex:
-                    match = random.random()
+                    match = self.model.draws.reproduction.random()
                     if self.reprod_rate > match:
-                        sex = bool(random.getrandbits(1))
-                        new_id = max([agent.unique_id for agent in self.model.schedule.agents])+1
+                        sex = self.model.draws.sex.random() < 0.5
+                        new_id = self.model.next_id()
                         a = Fox(new_id, self.model, sex, self.logger, reprod_rate = self.model.f_reprod_rate, 
                                 max_health = self.model.f_max_health)
                         try :
@@ -422,22 +414,23 @@ class Fox(Agent):
                             #y = self.random.randrange(self.grid.height)
                             self.model.grid.place_agent(a, self.pos)
                         except Exception as e:
-                            self.logger.warning(a, self.pos)
+                            self.logger.warning("Fox %s can't be placed in %s", a.unique_id, self.pos)
                             raise ValueError(e)
 
 
                         self.model.schedule.add(a)
-                        self.logger.info("HO WAW!! Rabbit {} and {} made baby {}!!".format(self.unique_id, cellmate.unique_id, a.unique_id))
+                        self.logger.info("HO WAW!! Fox %s and %s made baby %s!!", self.unique_id, cellmate.unique_id, a.unique_id)
                 break #Only reproducing with on rabbit per turn
 
 
-class Terrain(Agent):
-    """Terrain characteristics
+class Terrain:
+    """Terrain characteristics. Not an agent anymore : a read-only view of one cell
+    of the model altitude layer, never scheduled nor placed on the grid
     """
-    def __init__(self, model, altitude, unique_id):
-        super().__init__(unique_id, model)
-        self.unique_id = unique_id
-        self.altitude = altitude
+    def __init__(self, model, pos):
+        self.model = model
+        self.pos = pos
 
-    def step(self):
-        pass
+    @property
+    def altitude(self):
+        return self.model.get_altitude(self.pos)
@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+
+
+def write_atomic(path:str, write, directory:bool = False):
+    """Write a file or a folder aside, in the folder of path, then rename it to path : a concurrent
+    reader never sees a partial one, and a crash while writing keeps the previous one
+
+    Args:
+        path (str): final path of the file or folder
+        write (function): write(temporary) writes the content at the temporary path, which keeps
+            the extension of path
+        directory (bool, optional): path is a folder, written once : if another process renamed its
+            own folder first, it's kept and this one dropped. Defaults to False, a file replaces the previous one.
+
+    Returns:
+        bool: False if the folder of another process was kept
+    """
+    parent = os.path.dirname(path) or "."
+    if directory:
+        temporary = tempfile.mkdtemp(dir=parent)
+    else :
+        descriptor, temporary = tempfile.mkstemp(dir=parent, suffix=os.path.splitext(path)[1])
+        os.close(descriptor)
+    try :
+        write(temporary)
+        if not directory:
+            os.replace(temporary, path)
+            return True
+        try :
+            os.rename(temporary, path)
+        except OSError:
+            shutil.rmtree(temporary)
+            return False
+        return True
+    except BaseException:
+        if os.path.isdir(temporary):
+            shutil.rmtree(temporary)
+        elif os.path.exists(temporary):
+            os.remove(temporary)
+        raise
@@ -0,0 +1,109 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import count
+import os
+import time
+
+from mesa.batchrunner import BatchRunner
+import numpy as np
+from tqdm import tqdm
+
+
+def _run_wrapper(model_cls, kwargs, model_key, seed, max_steps, model_reporters):
+    """Run one model to completion in a worker process, as BatchRunner.run_model does
+
+    Args:
+        model_cls (class): model to run
+        kwargs (dict): model parameters
+        model_key (tuple): parameter values and run number
+        seed (int): seed of this run
+        max_steps (int): maximum number of steps
+        model_reporters (dict): name:function computed on the model at the end of the run
+
+    Returns:
+        tuple: (model_key, model reporters values and stop reason and step, datacollector dataframe)
+    """
+    model = model_cls(seed = seed, **kwargs)
+    while model.running and model.schedule.steps < max_steps:
+        model.step()
+
+    model_vars = None
+    if model_reporters:
+        model_vars = {var: reporter(model) for var, reporter in model_reporters.items()}
+    if getattr(model, "stop_conditions", None) is not None:
+        #Why and when the run stopped early, None if it ran all its steps
+        model_vars = model_vars or {}
+        model_vars["stop_reason"] = model.stop_reason
+        model_vars["stop_step"] = model.stop_step
+    collector_vars = None
+    if hasattr(model, "datacollector"):
+        collector_vars = model.datacollector.get_model_vars_dataframe()
+    return model_key, model_vars, collector_vars
+
+
+class ParallelBatchRunner(BatchRunner):
+    """BatchRunner spreading the runs over a process pool. Every (parameters, iteration) run gets
+    its own seed, results are stored as soon as a run finishes and throughput is reported in runs/s.
+    get_model_vars_dataframe returns the same table as the BatchRunner
+    """
+    def __init__(self, model_cls, variable_parameters = None, fixed_parameters = None, iterations:int = 1,
+            max_steps:int = 1000, model_reporters = None, processes:int = None, seed:int = None, display_progress:bool = True):
+        """Initialize a parallel batch runner
+
+        Args:
+            model_cls (class): Model to run, its constructor must accept a seed argument
+            variable_parameters (dict, optional): parameters to sweep, name:values. Defaults to None.
+            fixed_parameters (dict, optional): parameters fixed for every run. Defaults to None.
+            iterations (int, optional): Number of runs per parameters combination. Defaults to 1.
+            max_steps (int, optional): Maximum number of steps of a run. Defaults to 1000.
+            model_reporters (dict, optional): name:function computed on each model at the end of its run. Defaults to None.
+            processes (int, optional): Number of worker processes. Defaults to the number of cores.
+            seed (int, optional): Seed from which the seed of every run is derived. Defaults to None.
+            display_progress (bool, optional): Show a progress bar with runs/s. Defaults to True.
+        """
+        super().__init__(model_cls, variable_parameters = variable_parameters, fixed_parameters = fixed_parameters,
+                iterations = iterations, max_steps = max_steps, model_reporters = model_reporters,
+                display_progress = display_progress)
+        self.processes = processes or os.cpu_count()
+        self.seed = seed
+
+    def iter_runs(self):
+        """Run all the models and yield their results as soon as they finish
+
+        Yields:
+            tuple: (model_key, model reporters values, datacollector dataframe)
+        """
+        run_count = count()
+        total_iterations, all_kwargs, all_param_values = self._make_model_args()
+        seeds = np.random.SeedSequence(self.seed).generate_state(total_iterations, dtype=np.uint64)
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers = self.processes) as pool:
+            futures = []
+            for i, kwargs in enumerate(all_kwargs):
+                param_values = all_param_values[i]
+                for _ in range(self.iterations):
+                    run = next(run_count)
+                    if param_values is not None:
+                        model_key = tuple(param_values) + (run,)
+                    else:
+                        model_key = (run,)
+                    futures.append(pool.submit(_run_wrapper, self.model_cls, kwargs, model_key, int(seeds[run]),
+                            self.max_steps, self.model_reporters))
+
+            with tqdm(total = total_iterations, unit = "runs", disable = not self.display_progress) as pbar:
+                for future in as_completed(futures):
+                    yield future.result()
+                    pbar.update()
+        elapsed = time.perf_counter() - start
+        if self.display_progress:
+            print("{} runs in {:.1f}s, {:.2f} runs/s on {} processes".format(
+                total_iterations, elapsed, total_iterations/max(elapsed, 1e-9), self.processes))
+
+    def run_all(self):
+        """Run the model at all parameter combinations over the process pool and store results
+        """
+        for model_key, model_vars, collector_vars in self.iter_runs():
+            if model_vars is not None:
+                self.model_vars[model_key] = model_vars
+            if collector_vars is not None:
+                self.datacollector_model_reporters[model_key] = collector_vars
@@ -0,0 +1,175 @@
+import json
+
+import numpy as np
+
+from agents import Rabbit, Plant, Fox
+from atomic import write_atomic
+from collector import StreamingDataCollector
+from registry import SpeciesActivation
+
+#Attributes saved for each species, besides unique_id and position
+AGENT_ATTRIBUTES = {
+    Rabbit: ["_health", "carrot", "sex", "reprod_rate"],
+    Plant: ["size", "eatable", "grow_time", "reprod_rate"],
+    Fox: ["_health", "max_health", "eaten", "sex", "reprod_rate"],
+}
+LOGGER_SPECIES = {Rabbit: "rabbits", Plant: "plants", Fox: "foxes"}
+
+
+def save_checkpoint(model, path:str):
+    """Save a snapshot of a ForagingModel between two steps : parameters, terrain, id counter, random
+    generators state, schedule order, grid order, agents attributes and collected data.
+    The file is written with write_atomic, a crash while saving keeps the previous snapshot
+
+    Args:
+        model (ForagingModel): model to save
+        path (str): .npz file of the snapshot
+    """
+    meta = {
+        "params": {
+            "R": model.num_agents, "P": model.num_plants, "F": model.num_foxes,
+            "width": model.grid.width, "height": model.grid.height,
+            "p_reprod_rate": model.p_reprod_rate, "r_reprod_rate": model.r_reprod_rate,
+            "f_reprod_rate": model.f_reprod_rate, "r_max_health": model.r_max_health,
+            "f_max_health": model.f_max_health, "debug": model.debug, "engine": model.engine,
+            "plant_layer": model.plant_layer is not None, "stages": model.stages,
+            "stop_conditions": model.stop_conditions and model.stop_conditions.params,
+            },
+        "steps": model.schedule.steps,
+        "time": model.schedule.time,
+        "running": model.running,
+        "stop_reason": model.stop_reason,
+        "stop_step": model.stop_step,
+        "current_id": model.current_id,
+        "rng": model.rng.bit_generator.state,
+        "random": model.random.getstate(),
+        }
+    arrays = {"altitude": np.asarray(model.altitude)}
+    if model.plant_layer is not None:
+        arrays["plant_layer.sizes"] = model.plant_layer.sizes
+    if model.stop_conditions is not None:
+        meta["stop_recorded"] = model.stop_conditions.recorded
+        arrays["stop_window"] = model.stop_conditions.window
+
+    if model.engine == "agents":
+        agents = model.schedule.agents
+        arrays["schedule_order"] = np.array([agent.unique_id for agent in agents], dtype=np.int64)
+        #Order of the agents in the grid cells, cell after cell
+        arrays["grid_order"] = np.array([agent.unique_id for cell, x, y in model.grid.coord_iter() for agent in cell],
+                dtype=np.int64)
+        for species, attributes in AGENT_ATTRIBUTES.items():
+            members = [agent for agent in agents if type(agent) is species]
+            name = species.__name__
+            arrays[name + ".unique_id"] = np.array([agent.unique_id for agent in members], dtype=np.int64)
+            arrays[name + ".pos"] = np.array([agent.pos for agent in members], dtype=np.int64).reshape(-1, 2)
+            for attribute in attributes:
+                arrays[name + "." + attribute] = np.array([getattr(agent, attribute) for agent in members])
+        if isinstance(model.schedule, SpeciesActivation):
+            #Removed agents still hold their place in the activation lists
+            for species, (order, removed) in model.schedule.activation_lists().items():
+                arrays["activation." + species.__name__] = np.array(order, dtype=np.int64)
+                arrays["activation_removed." + species.__name__] = np.array(removed, dtype=np.int64)
+    else :
+        for species in AGENT_ATTRIBUTES:
+            for column, values in model.schedule._columns(species).items():
+                arrays[species.__name__ + "." + column] = values
+
+    collector = model.datacollector
+    if isinstance(collector, StreamingDataCollector):
+        meta["collector"] = {"path": collector.path, "interval": collector.interval, "chunk_size": collector.chunk_size,
+                "rows": collector.rows, "chunks": collector.chunks, "calls": collector.calls}
+        for name in collector.columns:
+            arrays["collector." + name] = collector.buffers[name][:collector.rows]
+    else :
+        meta["collector"] = None
+        for name, values in collector.model_vars.items():
+            arrays["collector." + name] = np.array(values)
+
+    arrays["meta"] = np.array(json.dumps(meta))
+    write_atomic(path, lambda temporary: np.savez_compressed(temporary, **arrays))
+
+
+def load_checkpoint(model_cls, path:str, **kwargs):
+    """Rebuild a model from a snapshot, the next step is the one the saved model would have made
+
+    Args:
+        model_cls (class): ForagingModel
+        path (str): .npz file of the snapshot
+        **kwargs: other arguments of the model (logging, checkpoints), not saved in the snapshot
+
+    Returns:
+        ForagingModel: the restored model
+    """
+    with np.load(path) as snapshot:
+        arrays = dict(snapshot)
+    meta = json.loads(str(arrays["meta"]))
+    params = dict(meta["params"])
+
+    #Empty model of the right size on the saved map, no terrain is generated, everything else is overwritten
+    initial = {"R": params.pop("R"), "P": params.pop("P"), "F": params.pop("F")}
+    model = model_cls(R=0, P=0, F=0, altitude=arrays["altitude"], **params, **kwargs)
+    model.num_agents, model.num_plants, model.num_foxes = initial["R"], initial["P"], initial["F"]
+    model.current_id = meta["current_id"]
+    model.running = meta["running"]
+    model.stop_reason = meta.get("stop_reason")
+    model.stop_step = meta.get("stop_step")
+    if model.stop_conditions is not None:
+        model.stop_conditions.recorded = meta["stop_recorded"]
+        model.stop_conditions.window = arrays["stop_window"]
+    model.rng.bit_generator.state = meta["rng"]
+    version, state, gauss = meta["random"]
+    model.random.setstate((version, tuple(state), gauss))
+
+    if model.plant_layer is not None:
+        model.plant_layer.sizes = arrays["plant_layer.sizes"]
+    if model.engine == "agents":
+        _restore_agents(model, arrays)
+    else :
+        engine = model.schedule
+        for species, columns in ((Rabbit, engine.rabbits), (Plant, engine.plants), (Fox, engine.foxes)):
+            for column in columns:
+                columns[column] = arrays[species.__name__ + "." + column]
+    model.schedule.steps = meta["steps"]
+    model.schedule.time = meta["time"]
+
+    if meta["collector"] is None:
+        model.datacollector.model_vars = {name: arrays["collector." + name].tolist()
+                for name in model.datacollector.model_reporters}
+    else :
+        saved = meta["collector"]
+        collector = StreamingDataCollector(model.datacollector.model_reporters, saved["path"], interval=saved["interval"],
+                chunk_size=saved["chunk_size"], keep_chunks=saved["chunks"])
+        for name in collector.columns:
+            collector.buffers[name][:saved["rows"]] = arrays["collector." + name]
+        collector.rows, collector.calls = saved["rows"], saved["calls"]
+        model.datacollector = collector
+    return model
+
+
+def _restore_agents(model, arrays):
+    """Recreate the agents, schedule them and place them in their saved orders
+    """
+    agents = {}
+    positions = {}
+    for species, attributes in AGENT_ATTRIBUTES.items():
+        name = species.__name__
+        logger = model.loggers[LOGGER_SPECIES[species]]
+        columns = [arrays[name + "." + attribute].tolist() for attribute in attributes]
+        for unique_id, pos, values in zip(arrays[name + ".unique_id"].tolist(), arrays[name + ".pos"].tolist(), zip(*columns)):
+            if species is Plant:
+                agent = Plant(unique_id, model, logger)
+            else :
+                agent = species(unique_id, model, False, logger)
+            for attribute, value in zip(attributes, values):
+                setattr(agent, attribute, value)
+            agents[unique_id] = agent
+            positions[unique_id] = tuple(pos)
+
+    for unique_id in arrays["schedule_order"].tolist():
+        model.schedule.add(agents[unique_id])
+    if isinstance(model.schedule, SpeciesActivation):
+        model.schedule.restore_activation_lists({species: (arrays["activation." + species.__name__].tolist(),
+                arrays["activation_removed." + species.__name__].tolist())
+                for species in AGENT_ATTRIBUTES if "activation." + species.__name__ in arrays}, agents)
+    for unique_id in arrays["grid_order"].tolist():
+        model.grid.place_agent(agents[unique_id], positions[unique_id])
@@ -0,0 +1,305 @@
+import os
+import zipfile
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from atomic import write_atomic
+
+
+class ChunkedReader:
+    """Lazy reader of the file of a ChunkedStore, chunks are only loaded when read
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self.chunks = {}
+        self.constants = {}
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if "/" in member:
+                    self.chunks.setdefault(member.split("/")[0], []).append(member)
+                else :
+                    with archive.open(member) as data:
+                        self.constants[member[:-len(".npy")]] = np.lib.format.read_array(data)
+        for members in self.chunks.values():
+            members.sort()
+
+    def iter_chunks(self, name:str, columns:list = None):
+        """Read an array chunk by chunk
+
+        Args:
+            name (str): name of the array
+            columns (list, optional): indices of the columns to keep, for arrays of rows. Defaults to all.
+
+        Yields:
+            np.ndarray: rows of one chunk
+        """
+        with zipfile.ZipFile(self.path) as archive:
+            for member in self.chunks.get(name, []):
+                with archive.open(member) as data:
+                    chunk = np.lib.format.read_array(data)
+                yield chunk if columns is None else chunk[:, columns]
+
+    def read(self, name:str, every:int = 1, columns:list = None):
+        """Load a whole array, optionally keeping one row every few rows
+
+        Args:
+            name (str): name of the array
+            every (int, optional): keep one row every `every` rows. Defaults to 1.
+            columns (list, optional): indices of the columns to keep, for arrays of rows. Defaults to all.
+
+        Returns:
+            np.ndarray: rows of every chunk
+        """
+        kept = []
+        offset = 0
+        for chunk in self.iter_chunks(name, columns):
+            kept.append(chunk[(-offset) % every::every])
+            offset = (offset + len(chunk)) % every
+        if not kept:
+            return np.empty((0,) if columns is None else (0, len(columns)))
+        return np.concatenate(kept)
+
+    def rows(self, name:str):
+        """Number of rows of an array, from the headers of its chunks
+
+        Args:
+            name (str): name of the array
+
+        Returns:
+            int: number of rows
+        """
+        rows = 0
+        with zipfile.ZipFile(self.path) as archive:
+            for member in self.chunks.get(name, []):
+                with archive.open(member) as data:
+                    version = np.lib.format.read_magic(data)
+                    read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+                    rows += read_header(data)[0][0]
+        return rows
+
+    def last(self, name:str):
+        """Last row of an array
+
+        Args:
+            name (str): name of the array
+
+        Returns:
+            np.ndarray: the row
+        """
+        with zipfile.ZipFile(self.path) as archive:
+            with archive.open(self.chunks[name][-1]) as data:
+                return np.lib.format.read_array(data)[-1]
+
+    def plot_every(self, name:str, max_points:int):
+        """Rows to skip so an array plots with at most about max_points points
+
+        Returns:
+            int: keep one row every this many rows
+        """
+        return max(1, -(-self.rows(name) // max_points))
+
+
+class ChunkedStore:
+    """Streaming store of rows of named arrays : rows are written in fixed-size buffers, flushed in chunks
+    to an .npz file instead of growing Python lists. Each chunk of each array is a member
+    "<name>/<chunk>.npy" of the archive, constants written once are members "<name>.npy", so long
+    runs are read back one chunk at a time with ChunkedReader
+    """
+    reader_class = ChunkedReader
+
+    def __init__(self, path:str, fields:dict, chunk_size:int, compression:int = zipfile.ZIP_DEFLATED,
+            keep_chunks:int = 0, constants:dict = None):
+        """Initialize the store, an existing file at path is overwritten
+
+        Args:
+            path (str): .npz file the chunks are written to
+            fields (dict): name:(dtype, shape of a row) of the arrays, in the order of the values of append
+            chunk_size (int): number of rows kept in memory before flushing
+            compression (int, optional): zipfile compression of the chunks. Defaults to zipfile.ZIP_DEFLATED.
+            keep_chunks (int, optional): keep the first chunks of an existing file and append after them,
+                when resuming a run from a checkpoint. Defaults to 0.
+            constants (dict, optional): name:array written once in a new file. Defaults to None.
+
+        Raises:
+            ValueError: Error if chunk_size is not positive
+        """
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be positive")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.buffers = {name: np.empty((chunk_size,) + tuple(shape), dtype=dtype) for name, (dtype, shape) in fields.items()}
+        self.rows = 0
+        self.chunks = keep_chunks
+        if os.path.exists(path):
+            if keep_chunks:
+                self._truncate(keep_chunks)
+                return
+            os.remove(path)
+        if constants:
+            with zipfile.ZipFile(path, mode="w", compression=compression) as archive:
+                for name, values in constants.items():
+                    with archive.open(name + ".npy", mode="w") as member:
+                        np.lib.format.write_array(member, np.asarray(values))
+
+    def append(self, values):
+        """Record a row
+
+        Args:
+            values (sequence): one value of each array, in the order of fields
+        """
+        for buffer, value in zip(self.buffers.values(), values):
+            buffer[self.rows] = value
+        self.rows += 1
+        if self.rows == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows to the file as a new chunk
+        """
+        if self.rows == 0:
+            return
+        with zipfile.ZipFile(self.path, mode="a", compression=self.compression) as archive:
+            for name, buffer in self.buffers.items():
+                with archive.open("{}/{:06d}.npy".format(name, self.chunks), mode="w") as member:
+                    np.lib.format.write_array(member, buffer[:self.rows])
+        self.chunks += 1
+        self.rows = 0
+
+    def _truncate(self, keep_chunks:int):
+        """Drop the chunks written after the first keep_chunks ones (after the checkpoint a run resumes from)
+        """
+        with zipfile.ZipFile(self.path) as archive:
+            members = archive.namelist()
+            kept = [member for member in members if "/" not in member or int(member.split("/")[1].split(".")[0]) < keep_chunks]
+        if len(kept) == len(members):
+            return
+
+        def write(temporary):
+            with zipfile.ZipFile(self.path) as archive, \
+                    zipfile.ZipFile(temporary, mode="w", compression=self.compression) as truncated:
+                for member in kept:
+                    truncated.writestr(member, archive.read(member))
+
+        write_atomic(self.path, write)
+
+    def close(self):
+        """Flush what's left, to be called at the end of a run
+        """
+        self.flush()
+
+    def reader(self):
+        """Flush and open the stored data
+
+        Returns:
+            ChunkedReader: lazy reader of the file, of the reader_class of the store
+        """
+        self.flush()
+        return self.reader_class(self.path)
+
+
+class CollectorReader(ChunkedReader):
+    """Lazy reader of the file of a StreamingDataCollector, chunks are only loaded when read
+    """
+    def __init__(self, path:str):
+        super().__init__(path)
+        self.columns = [column for column in self.chunks if column != "step"]
+
+    def column(self, column:str, every:int = 1):
+        """Load a whole column, optionally keeping one value every few rows
+
+        Args:
+            column (str): name of a reporter, or "step"
+            every (int, optional): keep one row every `every` rows. Defaults to 1.
+
+        Returns:
+            np.ndarray: values of the column
+        """
+        return self.read(column, every)
+
+    def dataframe(self, columns:list = None, every:int = 1):
+        """Load columns in a dataframe indexed by step
+
+        Args:
+            columns (list, optional): reporters to load. Defaults to all.
+            every (int, optional): keep one row every `every` rows. Defaults to 1.
+
+        Returns:
+            pd.DataFrame: data of the run
+        """
+        columns = columns or self.columns
+        data = pd.DataFrame({column: self.column(column, every) for column in columns},
+                index=self.column("step", every))
+        data.index.name = "step"
+        return data
+
+    def plot(self, columns:list = ["Rabbits", "Plants"], max_points:int = 10000, ax = None):
+        """Plot populations, reading the file chunk by chunk and keeping at most about max_points per column
+
+        Args:
+            columns (list, optional): reporters to plot. Defaults to ["Rabbits", "Plants"].
+            max_points (int, optional): maximum number of points per line. Defaults to 10000.
+            ax (matplotlib axes, optional): where to plot. Defaults to the current axes.
+
+        Returns:
+            matplotlib axes: the plot
+        """
+        ax = ax or plt.gca()
+        every = self.plot_every("step", max_points)
+        steps = self.column("step", every)
+        for column in columns:
+            ax.plot(steps, self.column(column, every), label=column)
+        ax.legend()
+        return ax
+
+
+class StreamingDataCollector(ChunkedStore):
+    """Datacollector for long runs : model reporters are columns of a compressed ChunkedStore, along
+    with the step they were collected at, read back one chunk at a time with CollectorReader
+    """
+    reader_class = CollectorReader
+
+    def __init__(self, model_reporters:dict, path:str, interval:int = 1, chunk_size:int = 4096, keep_chunks:int = 0):
+        """Initialize the collector, an existing file at path is overwritten
+
+        Args:
+            model_reporters (dict): name:function(model) of the values to collect
+            path (str): .npz file the chunks are written to
+            interval (int, optional): collect every interval calls of collect. Defaults to 1.
+            chunk_size (int, optional): number of rows kept in memory before flushing. Defaults to 4096.
+            keep_chunks (int, optional): keep the first chunks of an existing file and append after them,
+                when resuming a run from a checkpoint. Defaults to 0.
+
+        Raises:
+            ValueError: Error if interval or chunk_size is not positive
+        """
+        if interval < 1:
+            raise ValueError("Sampling interval and chunk size must be positive")
+        fields = {"step": (np.int64, ())}
+        fields.update((name, (np.float64, ())) for name in model_reporters)
+        super().__init__(path, fields, chunk_size, keep_chunks=keep_chunks)
+        self.model_reporters = model_reporters
+        self.interval = interval
+        self.columns = list(fields)
+        self.calls = 0
+
+    def collect(self, model):
+        """Record the model reporters, if this call falls on the sampling interval
+
+        Args:
+            model (mesa model): the model to collect data from
+        """
+        self.calls += 1
+        if (self.calls - 1) % self.interval:
+            return
+        self.append([model.schedule.steps] + [reporter(model) for reporter in self.model_reporters.values()])
+
+    def get_model_vars_dataframe(self):
+        """Same as the mesa datacollector, loads the whole history
+
+        Returns:
+            pd.DataFrame: one column per reporter, indexed by step
+        """
+        return self.reader().dataframe()
@@ -11,48 +11,56 @@ from mesa.batchrunner import BatchRunner
 import random
 import matplotlib.pyplot as plt
 import numpy as np
-import logging
-from scipy.ndimage import gaussian_filter #to smoothe the map
+import time
 
 from agents import Rabbit, Plant, Fox, Terrain
+from registry import SpeciesRegistry, RegistryActivation, SpeciesActivation
+from space import IndexedMultiGrid, transition_table
+from vectorized import VectorizedSchedule
+from random_draws import RandomDraws
+from agent_logging import setup_logging
+from collector import StreamingDataCollector
+from checkpoint import save_checkpoint, load_checkpoint
+from profiling import PhaseTimer
+from terrain import load_terrain, terrain_layers
+from plant_layer import PlantLayer
+from stopping import StopConditions
 
 #function to compute values for the datacollector
+#Counts are maintained incrementally by the model registry, no scan of the schedule
 def compute_population_r(model):
-    return len([agent for agent in model.schedule.agents if isinstance(agent, Rabbit)])
+    return model.registry.count(Rabbit)
 
 def compute_population_p(model):
-    return len([agent for agent in model.schedule.agents if isinstance(agent, Plant)])
+    if model.plant_layer is not None:
+        return model.plant_layer.count()
+    return model.registry.count(Plant)
 
 def compute_population_f(model):
-    return len([agent for agent in model.schedule.agents if isinstance(agent, Fox)])
+    return model.registry.count(Fox)
 
 def compute_population_t(model):
-    #Should be fixed
-    return len([agent for agent in model.schedule.agents if isinstance(agent, Terrain)])
+    #Terrain is not an agent anymore, one cell of the altitude layer per grid cell
+    return model.altitude.size
 
 def average_rabbit_health(model):
-    rabbits = [agent for agent in model.schedule.agents if isinstance(agent, Rabbit)]
-    agent_health = [agent.health for agent in rabbits]
-    return sum(agent_health) / len(agent_health)
+    return model.registry.average_health(Rabbit)
 
 
-def setup_logger(logger_name, log_file, level=logging.INFO):
-    l = logging.getLogger(logger_name)
-    formatter = logging.Formatter('%(asctime)s : %(message)s')
-    fileHandler = logging.FileHandler(log_file, mode='w')
-    fileHandler.setFormatter(formatter)
-    streamHandler = logging.StreamHandler()
-    streamHandler.setFormatter(formatter)
-
-    l.setLevel(level)
-    l.addHandler(fileHandler)
-    l.addHandler(streamHandler)    
+#Species names of the stages parameter
+SPECIES = {"plants": Plant, "rabbits": Rabbit, "foxes": Fox}
+#Population of each species, for the stop conditions
+POPULATIONS = {"plants": compute_population_p, "rabbits": compute_population_r, "foxes": compute_population_f}
 
 
 class ForagingModel(Model):
     def __init__(self, R:int, P:int, F:int, width:int, height:int, 
             p_reprod_rate:float = 0.05, r_reprod_rate:float = 0.5, f_reprod_rate:float = 0.3,
-            r_max_health:int = 4, f_max_health:int = 10):
+            r_max_health:int = 4, f_max_health:int = 10, debug:bool = False, engine:str = "agents",
+            seed:int = None, log_levels:dict = None, log_sampling:dict = None, silent:bool = False,
+            collector_path:str = None, collect_interval:int = 1, checkpoint_path:str = None, checkpoint_interval:int = 1000,
+            profile:bool = False, terrain_seed:int = None, terrain_sigma:float = 0.8, terrain_cache:str = None,
+            plant_layer:bool = False, stages:list = None, stop_conditions:dict = None, altitude = None):
         """Initialize a mesa model
 
         Args:
@@ -66,7 +74,64 @@ class ForagingModel(Model):
             f_reprod_rate (float, optional): Base reproduction rate of foxes. Defaults to 0.3.
             r_max_health (int, optional): Maximum number of days a rabbit can spend without eating. Defaults to 4.
             f_max_health (int, optional): Maximum number of days a fox can spend without eating. Defaults to 10.
+            debug (bool, optional): Cross-check the species registry and the grid index against a full scan of the agents every step. Defaults to False.
+            engine (str, optional): "agents" for one mesa agent per individual, "vectorized" for species stored as NumPy 
+                arrays and updated in batch, for large maps. Defaults to "agents".
+            seed (int, optional): Seed of the model random generator, the same seed gives the same run. Defaults to None.
+            log_levels (dict, optional): Logging level by species ("rabbits", "plants", "foxes", "model"). Defaults to INFO for all.
+            log_sampling (dict, optional): Fraction of the log records kept by species. Defaults to 1 for all.
+            silent (bool, optional): No logging at all, log messages are not even formatted. Defaults to False.
+            collector_path (str, optional): If set, data is streamed in chunks to this .npz file instead of being
+                kept in memory by the mesa datacollector. Defaults to None.
+            collect_interval (int, optional): Collect data every collect_interval steps, with collector_path. Defaults to 1.
+            checkpoint_path (str, optional): If set, a snapshot of the model is saved to this .npz file every 
+                checkpoint_interval steps, see ForagingModel.load. Defaults to None.
+            checkpoint_interval (int, optional): Steps between two snapshots. Defaults to 1000.
+            profile (bool, optional): Record the time spent in each phase of each agent type, see model.timer. Defaults to False.
+            terrain_seed (int, optional): Seed of the map, models with the same terrain seed share the same map.
+                Defaults to None, drawn from the model generator.
+            terrain_sigma (float, optional): Smoothing of the map. Defaults to 0.8.
+            terrain_cache (str, optional): Folder where generated maps are cached and reloaded from. Defaults to None, no cache.
+            plant_layer (bool, optional): With the agents engine, plants are per-cell arrays updated as a whole
+                (see PlantLayer) instead of agents. Defaults to False.
+            stages (list, optional): With the agents engine, activate the species one after the other in this order,
+                e.g. ["plants", "rabbits", "foxes"], in random order inside each species (see SpeciesActivation).
+                Defaults to None, all the agents in one random order.
+            stop_conditions (dict, optional): Arguments of StopConditions, e.g. {"extinction": "any", "steady_window": 200} :
+                the model stops running (model.running is False) when one is met, and records why in
+                model.stop_reason and when in model.stop_step. Defaults to None, runs never stop by themselves.
+            altitude (np.ndarray, optional): Altitudes of the map, indexed by (x, y), instead of a generated terrain,
+                e.g. when restoring a snapshot. Defaults to None, the map is generated.
+
+        Raises:
+            ValueError: Error if the engine doesn't exist, a stage is not a species, or the plant layer
+                or stages are used with the vectorized engine
         """
+        #Sets up current_id, the counter behind Model.next_id : it only ever increases,
+        #so ids of removed agents are never reused, and it's saved along with the model
+        super().__init__()
+        if engine not in ("agents", "vectorized"):
+            raise ValueError("Engine must be 'agents' or 'vectorized', not {}".format(engine))
+        if plant_layer and engine != "agents":
+            raise ValueError("The plant layer is for the agents engine, the vectorized engine already stores plants as arrays")
+        if stages is not None:
+            if engine != "agents":
+                raise ValueError("Stages are for the agents engine, the vectorized engine always runs plants, rabbits then foxes")
+            for stage in stages:
+                if stage not in SPECIES:
+                    raise ValueError("No species {}, stages must be some of {}".format(stage, list(SPECIES)))
+        self.engine = engine
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        #Time spent in each phase of the agents, None when not profiling
+        self.timer = PhaseTimer() if profile else None
+
+        #All the randomness of a run comes from this generator
+        self.rng = np.random.default_rng(seed)
+        #mesa shares its random.Random between models of the same class, the scheduler gets its own
+        self.random = random.Random(int(self.rng.integers(2**63)))
+        #Pre-drawn random numbers consumed by the agents, refilled every step
+        self.draws = RandomDraws(self.rng)
         
         #Number of rabbits and plants
         self.num_agents = R
@@ -80,116 +145,251 @@ class ForagingModel(Model):
         self.f_reprod_rate = f_reprod_rate
         self.r_max_health = r_max_health
         self.f_max_health = f_max_health
-        #Create space
-        self.grid = MultiGrid(width, height, True)
+        #Create space, indexed by species for the cellmates queries
+        self.grid = IndexedMultiGrid(width, height, True)
         
-        #Activation of the agents every step is random
-        self.schedule = RandomActivation(self)
+        #Population counters by species, updated by the scheduler on every add/remove
+        self.registry = SpeciesRegistry()
+        self.debug = debug
+
+        #Activation of the agents every step is random, for all the agents at once or species after species
+        if stages is None:
+            self.schedule = RegistryActivation(self)
+        else :
+            self.schedule = SpeciesActivation(self, [SPECIES[stage] for stage in stages])
+        self.stages = stages
 
         #running variable for the batch runner. Simulation stops if a certain condition is met
         #If set to True, obviously never stops
         self.running = True
+        self.stop_conditions = StopConditions(**stop_conditions) if stop_conditions else None
+        self.stop_reason = None
+        self.stop_step = None
 
-        #Initialize loggers 
-        setup_logger('rabbits_logger', "logs/rabbits_agents.log")
-        setup_logger('plants_logger', "logs/plants_agents.log")
-        setup_logger('fox_logger', "logs/fox_agents.log")
-        setup_logger('model_logger', "logs/model.log")
-        rabbits_logger = logging.getLogger('rabbits_logger')
-        plants_logger = logging.getLogger('plants_logger')
-        fox_logger = logging.getLogger('fox_logger')
-        model_logger = logging.getLogger('model_logger')
-
-        # Create Rabbits
-        for i in range(self.num_agents):
-            sex = bool(random.getrandbits(1))
-            a = Rabbit(i, self, sex, rabbits_logger, reprod_rate = self.r_reprod_rate, max_health = r_max_health)
-            self.schedule.add(a)
-
-            #Agent is activated in a random grid cell
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.grid.place_agent(a, (x, y))
-        
-        # Create Plants
-        for i in range(self.num_plants):
-            a = Plant(i+self.num_agents, self, plants_logger, reprod_rate = self.p_reprod_rate)
-            self.schedule.add(a)
+        #Loggers of this model, handlers are only installed by the first model of the process
+        self.loggers = setup_logging(levels = log_levels, sampling = log_sampling, silent = silent)
+        rabbits_logger = self.loggers["rabbits"]
+        plants_logger = self.loggers["plants"]
+        fox_logger = self.loggers["foxes"]
 
-            #Agent is activated in a random grid cell
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.grid.place_agent(a, (x, y))
-        
-        # Create Foxes
-        for i in range(self.num_foxes):
-            current_id = self.num_agents+self.num_plants+i
-            sex = bool(random.getrandbits(1))
-            a = Fox(current_id, self, sex, fox_logger, reprod_rate = self.f_reprod_rate, max_health = f_max_health)
-            self.schedule.add(a)
+        #Generate a map, or use the given one
+        if altitude is None:
+            self.generate_map(width, height, seed = terrain_seed, sigma = terrain_sigma, cache_dir = terrain_cache)
+        else :
+            self.set_altitude(altitude)
 
-            #Agent is activated in a random grid cell
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.grid.place_agent(a, (x, y))
-       
-        #Generate a map
-        self.generate_map(width, height, current_id+1)
+        #Plants as agents, or as arrays of the plant layer
+        self.plant_layer = PlantLayer(self) if plant_layer else None
+        if engine == "agents":
+            self.create_agents(rabbits_logger, plants_logger, fox_logger)
+        else :
+            #Species are arrays, the engine is both the scheduler and the registry
+            self.schedule = VectorizedSchedule(self)
+            self.registry = self.schedule
         
         #Initialize the data collector when model is initialized
         #self.datacollector = DataCollector(
         #        model_reporters={"Gini": compute_gini, "health":average_rabbit_health},  # the functions are defined above with computaion for the colleor
         #        agent_reporters={"Carrot": "carrot"}) #agent-level data
-        self.datacollector = DataCollector(
-                model_reporters={
+        model_reporters = {
                     "Rabbits":compute_population_r, 
                     "Plants":compute_population_p,
                     "Foxes":compute_population_f,
                     "plants_reprod": lambda model : model.p_reprod_rate,
                     "foxes_reprod": lambda model : model.f_reprod_rate,
                     "rabbits_reprod": lambda model : model.r_reprod_rate
-                    }) #agent-level data
+                    }
+        if collector_path is None:
+            self.datacollector = DataCollector(model_reporters=model_reporters) #agent-level data
+        else:
+            #Long runs : fixed-size buffers flushed to disk
+            self.datacollector = StreamingDataCollector(model_reporters, collector_path, interval = collect_interval)
+        if self.timer is not None:
+            self.timer.instrument(self.datacollector, ["collect"])
 
     def step(self):
         """Avance the scheduler one step and collect data
         """
+        if self.timer is not None:
+            start = time.perf_counter()
+        if self.debug and self.engine == "agents":
+            self.registry.check(self.schedule.agents)
+            self.grid.check()
         #collect data
         self.datacollector.collect(self)
+        if self.engine == "agents":
+            self.draws.refill(self.schedule.get_agent_count())
+        #Plants of the plant layer all step at once, before the animals
+        if self.plant_layer is not None:
+            self.plant_layer.step()
         #advance simulation one step
         self.schedule.step()
+        if self.stop_conditions is not None and self.running:
+            self.check_stop()
+        if self.checkpoint_path is not None and self.schedule.steps % self.checkpoint_interval == 0:
+            self.save(self.checkpoint_path)
+        if self.timer is not None:
+            self.timer.record("ForagingModel", "step", time.perf_counter() - start)
+            self.timer.end_step(self.schedule.steps)
+
+    def check_stop(self):
+        """Test the stop conditions on the populations of the step that just ended, and stop the model if one is met
+        """
+        reason = self.stop_conditions.check({species: counter(self) for species, counter in POPULATIONS.items()})
+        if reason is not None:
+            self.running = False
+            self.stop_reason = reason
+            self.stop_step = self.schedule.steps
+            self.loggers["model"].info("Model stopped at step %s : %s", self.stop_step, reason)
+
+    def save(self, path:str):
+        """Save a snapshot of the model, to resume the run later with ForagingModel.load
 
-    def get_next_id(self):
-        """Compute next unique_id for a new agent
+        Args:
+            path (str): .npz file of the snapshot
+        """
+        save_checkpoint(self, path)
+
+    @classmethod
+    def load(cls, path:str, **kwargs):
+        """Resume a model from a snapshot, it continues exactly as if it had never stopped.
+        The collector settings come from the snapshot, a streaming collector keeps appending to its file
+
+        Args:
+            path (str): .npz file of the snapshot
+            **kwargs: logging and checkpoint arguments of the model, they're not saved in the snapshot
 
         Returns:
-            tuple: (next_id:int, all_ids:list)
+            ForagingModel: the restored model
         """
-        next_one = max([agent.unique_id for agent in self.schedule.agents])+1
-        all_ids = [agent.unique_id for agent in self.schedule.agents]
-        return next_one, all_ids
+        return load_checkpoint(cls, path, **kwargs)
+
+    def create_agents(self, rabbits_logger, plants_logger, fox_logger):
+        """Create the initial rabbits, plants and foxes, at random positions
+
+        Args:
+            rabbits_logger (logger): logger for the rabbits
+            plants_logger (logger): logger for the plants
+            fox_logger (logger): logger for the foxes
+        """
+        # Create Rabbits
+        for i in range(self.num_agents):
+            sex = bool(self.rng.integers(2))
+            a = Rabbit(self.next_id(), self, sex, rabbits_logger, reprod_rate = self.r_reprod_rate, max_health = self.r_max_health)
+            self.schedule.add(a)
+
+            #Agent is activated in a random grid cell
+            x = int(self.rng.integers(self.grid.width))
+            y = int(self.rng.integers(self.grid.height))
+            self.grid.place_agent(a, (x, y))
+        
+        # Create Plants
+        if self.plant_layer is not None:
+            x = self.rng.integers(self.grid.width, size=self.num_plants)
+            y = self.rng.integers(self.grid.height, size=self.num_plants)
+            self.plant_layer.add(x*self.grid.height + y)
+        for i in range(0 if self.plant_layer is not None else self.num_plants):
+            a = Plant(self.next_id(), self, plants_logger, reprod_rate = self.p_reprod_rate)
+            self.schedule.add(a)
+
+            #Agent is activated in a random grid cell
+            x = int(self.rng.integers(self.grid.width))
+            y = int(self.rng.integers(self.grid.height))
+            self.grid.place_agent(a, (x, y))
+        
+        # Create Foxes
+        for i in range(self.num_foxes):
+            sex = bool(self.rng.integers(2))
+            a = Fox(self.next_id(), self, sex, fox_logger, reprod_rate = self.f_reprod_rate, max_health = self.f_max_health)
+            self.schedule.add(a)
 
-    def generate_map(self, width:int, height:int, current_id:int):
-        """Generate the terrain on the map
+            #Agent is activated in a random grid cell
+            x = int(self.rng.integers(self.grid.width))
+            y = int(self.rng.integers(self.grid.height))
+            self.grid.place_agent(a, (x, y))
+
+    def generate_map(self, width:int, height:int, seed:int = None, sigma:float = 0.8, cache_dir:str = None):
+        """Generate the terrain on the map. Altitude is stored as an array indexed by (x, y)
+        instead of one Terrain agent per cell, so lookups from agents are O(1)
 
         Args:
             width (int): width of the map
             height (int): height of the map
-            current_id (int): id of the latest agent
+            seed (int, optional): seed of the terrain. Defaults to None, drawn from the model generator.
+            sigma (float, optional): smoothing of the altitudes. Defaults to 0.8.
+            cache_dir (str, optional): folder of the terrain cache, see terrain.load_terrain. Defaults to None.
         """
         #Altitude needs to be kinda smooth, not just completely random - Maybe use a convolutional matrix
         #implement movement dependant on altitude for rabbits and foxes (and plants for rivers)
         #show in nicely in viz - In shades of grey + rivers, fill the whole cell
         # plant : don't germinate in water
-        map_size = width*height
-        list_altitudes = random.choices(list(range(-30, 100)), k=map_size)
-        array_altitude = np.array(list_altitudes).reshape(width, height)
-        array_altitude = gaussian_filter(array_altitude, sigma=0.8, truncate = 1.5)
-
-        for x in range(0, width):
-            for y in range(0, height):
-                local_altitude = array_altitude[x, y]
-                a = Terrain(self, local_altitude, current_id+(width*y)+x)
-                self.grid.place_agent(a, pos = (x, y))
-                #Probably useless?
-                self.schedule.add(a)
-        
+        if seed is None:
+            #The same model seed still gives the same map
+            seed = int(self.rng.integers(2**63))
+        terrain = load_terrain(width, height, seed, sigma, cache_dir)
+        self.set_altitude(terrain["altitude"], terrain)
+
+    def set_altitude(self, altitude, layers:dict = None):
+        """Set the altitude layer and the layers derived from it : land mask, slope and the kind of
+        every move from each cell to its neighbours (into water, uphill, downhill), looked up by the animals
+
+        Args:
+            altitude (np.ndarray): altitudes, indexed by (x, y)
+            layers (dict, optional): land and slope, if already computed. Defaults to None.
+        """
+        if layers is None:
+            layers = terrain_layers(altitude)
+        #Terrain never changes during a run
+        for layer in (altitude, layers["land"], layers["slope"]):
+            layer.flags.writeable = False
+        self._altitude = altitude
+        self.land = layers["land"]
+        self.slope = layers["slope"]
+        self.transitions = transition_table(altitude, self.grid.moore)
+        self._move_rows = None
+
+    @property
+    def altitude(self):
+        """Read-only altitude layer of the map
+
+        Returns:
+            np.ndarray: altitudes, indexed by (x, y)
+        """
+        return self._altitude
+
+    def get_altitude(self, pos:tuple):
+        """Altitude of a single cell
+
+        Args:
+            pos (tuple): (x, y) position on the grid
+
+        Returns:
+            int: altitude of the cell, negative values are water
+        """
+        return self._altitude[pos]
+
+    def random_move(self, pos:tuple, stream):
+        """Random move to a neighbouring cell
+
+        Args:
+            pos (tuple): (x, y) position on the grid
+            stream (RandomStream): random stream drawing the neighbour
+
+        Returns:
+            tuple: (x, y) position of the neighbour, and kind of the move (BLOCKED, STEP or DOWNHILL)
+        """
+        if self._move_rows is None:
+            self._move_rows = self.grid.position_rows(self.grid.moore, self.transitions)
+        x, y = pos
+        return stream.choice(self._move_rows[x*self.grid.height + y])
+
+    def get_terrain(self, pos:tuple):
+        """Read-only view of a cell of the map, for visualization purposes
+
+        Args:
+            pos (tuple): (x, y) position on the grid
+
+        Returns:
+            Terrain: terrain of the cell
+        """
+        return Terrain(self, pos)
@@ -1,8 +1,13 @@
 from mesa.visualization.modules import CanvasGrid
 from mesa.visualization.ModularVisualization import ModularServer
 from mesa.visualization.modules import ChartModule
+from mesa.visualization.ModularVisualization import VisualizationElement
 from mesa.visualization.UserParam import UserSettableParameter                                               
 from model import *
+from render import altitude_shade
+import json
+import os
+import tornado.web
 
 #Agents representation
 def agent_portrayal(agent):
@@ -61,10 +66,96 @@ def agent_portrayal_with_altitude(agent):
 
     return portrayal
 
-def altitude_shade(altitude):
-    #Approx returns an HTML code for a shade of grey depending on altitude, I stay in decimal base because I'm lazy
-    html_shade = "#"+str(int(100 -(altitude)))*3
-    return html_shade
+class DeltaCanvasGrid(VisualizationElement):
+    """Canvas grid drawing the terrain once as a static background, then sending each frame only the
+    objects that appeared, moved or changed portrayal since the previous frame, and the ones that
+    disappeared (see DeltaCanvasModule.js). Frames grow with the activity of the model, not with the
+    size of the map. The previous frame is kept on the server, so the grid is meant for one browser at a time
+    """
+    package_includes = ["GridDraw.js"]
+    #Served from the folder of this module by ForagingServer
+    local_includes = ["DeltaCanvasModule.js"]
+
+    def __init__(self, portrayal_method, grid_width:int, grid_height:int, canvas_width:int = 500, canvas_height:int = 500):
+        """Instantiate a new canvas grid
+
+        Args:
+            portrayal_method (function): portrayal of an agent, or of a Terrain for the background
+            grid_width (int): width of the grid, in cells
+            grid_height (int): height of the grid, in cells
+            canvas_width (int, optional): width of the canvas, in pixels. Defaults to 500.
+            canvas_height (int, optional): height of the canvas, in pixels. Defaults to 500.
+        """
+        self.portrayal_method = portrayal_method
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.js_code = "elements.push(new DeltaCanvasModule({}, {}, {}, {}));".format(
+                canvas_width, canvas_height, grid_width, grid_height)
+        #Model of the previous frame, and what the browser was sent
+        self._model = None
+        self._styles = {}
+        self._sent = {}
+
+    def render(self, model):
+        frame = {"full": model is not self._model, "styles": [], "set": {}, "removed": []}
+        if frame["full"]:
+            #New model (start or reset) : the browser starts over
+            self._model = model
+            self._styles = {}
+            self._sent = {}
+            frame["terrain"] = self.render_terrain(model)
+
+        current = {}
+        for agent in model.schedule.agents:
+            if agent.pos is None:
+                continue
+            portrayal = self.portrayal_method(agent)
+            if portrayal:
+                current[str(agent.unique_id)] = [agent.pos[0], agent.pos[1], self._style(portrayal, frame)]
+        for key, value in current.items():
+            if self._sent.get(key) != value:
+                frame["set"][key] = value
+        frame["removed"] = [key for key in self._sent if key not in current]
+        self._sent = current
+        return frame
+
+    def render_terrain(self, model):
+        """Portrayals of the terrain, as a palette and the palette index of every cell
+        """
+        palette = {}
+        cells = []
+        for x in range(model.grid.width):
+            for y in range(model.grid.height):
+                portrayal = self.portrayal_method(model.get_terrain((x, y)))
+                if not portrayal:
+                    cells.append(-1)
+                    continue
+                key = json.dumps(portrayal, sort_keys=True)
+                cells.append(palette.setdefault(key, len(palette)))
+        return {"palette": [json.loads(key) for key in palette], "cells": cells}
+
+    def _style(self, portrayal, frame):
+        #Index of a portrayal in the styles of the browser, new ones are sent with the frame
+        key = json.dumps(portrayal, sort_keys=True)
+        if key not in self._styles:
+            self._styles[key] = len(self._styles)
+            frame["styles"].append(portrayal)
+        return self._styles[key]
+
+
+class ForagingServer(ModularServer):
+    """Mesa server serving the local includes of the elements (DeltaCanvasModule.js) from the folder of
+    this module, the default handler serves them from the folder the server is launched from
+    """
+    def __init__(self, *args, **kwargs):
+        #Resolved when the server starts, whatever the working directory
+        folder = os.path.dirname(os.path.abspath(__file__))
+        self.handlers = [(r"/local/(.*)", tornado.web.StaticFileHandler, {"path": folder})] + \
+                [handler for handler in ModularServer.handlers if handler is not ModularServer.local_handler]
+        super().__init__(*args, **kwargs)
+
 
 
 
@@ -105,11 +196,11 @@ def foraging_visualisation(species_to_display:list = ["rabbits", "foxes"], size:
         "f_max_health": UserSettableParameter("slider", "Foxes starving tolerance (steps)", 15, 5, 25, 1, 1)
     }
     if debug :
-        grid = CanvasGrid(agent_portrayal_with_altitude, size[0], size[1], 500, 500)#XcellsNumber, YCellsNumber, XPixels, YPixels
+        grid = DeltaCanvasGrid(agent_portrayal_with_altitude, size[0], size[1], 500, 500)#XcellsNumber, YCellsNumber, XPixels, YPixels
     else : 
-        grid = CanvasGrid(agent_portrayal_with_altitude, size[0], size[1], 500, 500)#XcellsNumber, YCellsNumber, XPixels, YPixels
+        grid = DeltaCanvasGrid(agent_portrayal_with_altitude, size[0], size[1], 500, 500)#XcellsNumber, YCellsNumber, XPixels, YPixels
 
-    server = ModularServer(ForagingModel,
+    server = ForagingServer(ForagingModel,
                        [grid, chart],
                        "Foraging Model",
                        model_params)
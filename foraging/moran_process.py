@@ -1,33 +1,207 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import os
+import time
+
 import axelrod as axl
-from pprint import pprint
-import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+
+def wilson_interval(successes, runs, z:float = 1.96):
+    """Wilson score confidence interval of a proportion, well behaved for probabilities close to 0 or 1
+
+    Args:
+        successes (np.ndarray): number of successes
+        runs (int): number of trials
+        z (float, optional): quantile of the normal distribution, 1.96 for 95%. Defaults to 1.96.
+
+    Returns:
+        tuple: lower and upper bounds
+    """
+    successes = np.asarray(successes, dtype=np.float64)
+    if runs == 0:
+        return np.zeros_like(successes), np.ones_like(successes)
+    proportion = successes/runs
+    center = (proportion + z**2/(2*runs))/(1 + z**2/runs)
+    half_width = z*np.sqrt(proportion*(1 - proportion)/runs + z**2/(4*runs**2))/(1 + z**2/runs)
+    return np.maximum(center - half_width, 0), np.minimum(center + half_width, 1)
+
+
+def _moran_run(players:list, seed:int, moran_kwargs:dict, max_generations:int):
+    """Play one Moran process in a worker process until a strategy takes over the population
+
+    Args:
+        players (list): axelrod players of the initial population
+        seed (int): seed of this run
+        moran_kwargs (dict): other arguments of axl.MoranProcess (mutation_rate, turns...)
+        max_generations (int): give up after this many generations, a process with mutations might never fixate
+
+    Returns:
+        tuple: (name of the fixated strategy or None, number of generations)
+    """
+    mp = axl.MoranProcess(players, seed = seed, **moran_kwargs)
+    for _ in mp:
+        if len(mp.population_distribution()) == 1 or len(mp.populations) >= max_generations:
+            break
+    distribution = mp.population_distribution()
+    winner = next(iter(distribution)) if len(distribution) == 1 else None
+    return winner, len(mp.populations)
+
+
+class MoranEnsemble:
+    """Runs many Moran processes of the same players over a process pool, to estimate the fixation
+    probability of each strategy. Runs are counted in the order of their seeds, whatever the order they
+    finish in, and the ensemble stops as soon as the confidence interval of every strategy is narrower
+    than ci_width, so the estimate only depends on the seed
+    """
+    def __init__(self, players:list, ci_width:float = 0.05, z:float = 1.96, min_runs:int = 100, max_runs:int = 10000,
+            max_generations:int = 10000, processes:int = None, seed:int = None, display_progress:bool = True, **moran_kwargs):
+        """Initialize the ensemble
+
+        Args:
+            players (list): axelrod players of the initial population
+            ci_width (float, optional): stop when every confidence interval is narrower than this. Defaults to 0.05.
+            z (float, optional): quantile of the normal distribution of the intervals, 1.96 for 95%. Defaults to 1.96.
+            min_runs (int, optional): runs before the intervals are tested. Defaults to 100.
+            max_runs (int, optional): stop after this many runs even if the intervals are wider. Defaults to 10000.
+            max_generations (int, optional): maximum number of generations of a run. Defaults to 10000.
+            processes (int, optional): Number of worker processes. Defaults to the number of cores.
+            seed (int, optional): Seed from which the seed of every run is derived. Defaults to None.
+            display_progress (bool, optional): Show a progress bar with runs/s. Defaults to True.
+            **moran_kwargs: other arguments of axl.MoranProcess (mutation_rate, mutation_method, turns...)
+
+        Raises:
+            ValueError: Error if the interval width is not between 0 and 1, or min_runs is above max_runs
+        """
+        if not 0 < ci_width < 1:
+            raise ValueError("Confidence interval width must be between 0 and 1")
+        if min_runs > max_runs:
+            raise ValueError("min_runs must not be above max_runs")
+        self.players = players
+        self.ci_width = ci_width
+        self.z = z
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.max_generations = max_generations
+        self.processes = processes or os.cpu_count()
+        self.seed = seed
+        self.display_progress = display_progress
+        self.moran_kwargs = moran_kwargs
+
+        self.strategies = sorted({str(player) for player in players})
+        self.runs = []
+
+    def converged(self, fixations:dict, runs:int):
+        """Test whether every strategy has a narrow enough confidence interval
+
+        Args:
+            fixations (dict): number of fixations by strategy name
+            runs (int): number of runs
+
+        Returns:
+            bool: True if the ensemble can stop
+        """
+        if runs < self.min_runs:
+            return False
+        low, high = wilson_interval([fixations.get(strategy, 0) for strategy in self.strategies], runs, self.z)
+        return bool((high - low < self.ci_width).all())
+
+    def iter_runs(self):
+        """Run Moran processes until convergence and yield their results in seed order, as soon as they are known
+
+        Yields:
+            dict: run number, seed, fixated strategy (None if none did) and number of generations
+        """
+        seeds = np.random.SeedSequence(self.seed).generate_state(self.max_runs, dtype=np.uint32)
+        fixations = {}
+        finished = {}
+        counted = 0
+        submitted = 0
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers = self.processes) as pool, \
+                tqdm(total = self.max_runs, unit = "runs", disable = not self.display_progress) as pbar:
+            pending = {}
+            stop = False
+            while not stop and counted < self.max_runs:
+                #Keep every worker busy, with a few runs in advance
+                while submitted < self.max_runs and len(pending) < 2*self.processes:
+                    future = pool.submit(_moran_run, self.players, int(seeds[submitted]), self.moran_kwargs, self.max_generations)
+                    pending[future] = submitted
+                    submitted += 1
+                done, _ = wait(pending, return_when = FIRST_COMPLETED)
+                for future in done:
+                    finished[pending.pop(future)] = future.result()
+                #Count the finished runs that follow the last counted one
+                while not stop and counted in finished:
+                    winner, generations = finished.pop(counted)
+                    if winner is not None:
+                        fixations[winner] = fixations.get(winner, 0) + 1
+                    yield {"run": counted, "seed": int(seeds[counted]), "winner": winner, "generations": generations}
+                    counted += 1
+                    pbar.update()
+                    stop = self.converged(fixations, counted)
+            for future in pending:
+                future.cancel()
+        elapsed = time.perf_counter() - start
+        if self.display_progress:
+            print("{} runs in {:.1f}s, {:.2f} runs/s on {} processes".format(
+                counted, elapsed, counted/max(elapsed, 1e-9), self.processes))
+
+    def run_all(self):
+        """Run the ensemble and store the results of its runs
+
+        Returns:
+            pd.DataFrame: fixation probabilities, see get_summary_dataframe
+        """
+        self.runs = list(self.iter_runs())
+        return self.get_summary_dataframe()
+
+    def get_runs_dataframe(self):
+        """One row per run
 
-players = [axl.Alternator(), axl.TitForTat(), axl.Grudger(), axl.Cooperator(), axl.Cooperator(), axl.Cooperator(),
-        axl.TitForTat(), axl.TitForTat(), axl.TitForTat(),
-        axl.Random()]
+        Returns:
+            pd.DataFrame: run, seed, winner and generations columns
+        """
+        return pd.DataFrame(self.runs, columns = ["run", "seed", "winner", "generations"])
 
+    def get_summary_dataframe(self):
+        """One row per strategy, plus a None row for the runs that never fixated
 
-#Basic process
-mp = axl.MoranProcess(players, seed = 14)
-populations = mp.play()
+        Returns:
+            pd.DataFrame: strategy, fixations, runs, fixation probability, its confidence interval,
+                mean generations to fixation
+        """
+        runs = self.get_runs_dataframe()
+        strategies = self.strategies + sorted(set(runs.winner.dropna()) - set(self.strategies))
+        fixations = runs.winner.value_counts()
+        summary = pd.DataFrame({"strategy": strategies + [None]})
+        summary["fixations"] = [int(fixations.get(strategy, 0)) for strategy in strategies] + [int(runs.winner.isna().sum())]
+        summary["runs"] = len(runs)
+        summary["probability"] = summary.fixations/max(len(runs), 1)
+        summary["ci_low"], summary["ci_high"] = wilson_interval(summary.fixations, len(runs), self.z)
+        generations = runs.groupby(runs.winner.fillna("None")).generations.mean()
+        summary["mean_generations"] = [generations.get(strategy, np.nan) for strategy in strategies] + [generations.get("None", np.nan)]
+        return summary
 
-pprint(populations)
-ax = mp.populations_plot()
-plt.show() 
 
-#Changing the mutation rate
-mp = axl.MoranProcess(players, mutation_rate=0.1, seed=10)
-for _ in mp:
-    if len(mp.population_distribution()) == 1:
-        break
+if __name__ == "__main__":
+    players = [axl.Alternator(), axl.TitForTat(), axl.Grudger(), axl.Cooperator(), axl.Cooperator(), axl.Cooperator(),
+            axl.TitForTat(), axl.TitForTat(), axl.TitForTat(),
+            axl.Random()]
 
+    #Basic process : fixation probability of each strategy
+    ensemble = MoranEnsemble(players, ci_width = 0.05, seed = 14)
+    print(ensemble.run_all())
 
-#Evolutive process : might not converge
-C = axl.Action.C
-players = [axl.EvolvableFSMPlayer(num_states=2, initial_state=1, initial_action=C) for _ in range(5)]
-mp = axl.MoranProcess(players, turns=10, mutation_method="atomic", seed=1)
-population = mp.play()  
+    #Changing the mutation rate : the population is never fixed for good, runs end when one strategy is left
+    ensemble = MoranEnsemble(players, ci_width = 0.1, seed = 10, mutation_rate = 0.1)
+    print(ensemble.run_all())
 
-pprint(populations)
-ax = mp.populations_plot()
-plt.show() 
+    #Evolutive process : might not converge
+    C = axl.Action.C
+    players = [axl.EvolvableFSMPlayer(num_states=2, initial_state=1, initial_action=C) for _ in range(5)]
+    ensemble = MoranEnsemble(players, ci_width = 0.1, max_runs = 200, max_generations = 1000, seed = 1,
+            turns = 10, mutation_method = "atomic")
+    print(ensemble.run_all())
@@ -0,0 +1,138 @@
+from bisect import bisect_right
+
+import numpy as np
+
+
+class PlantLayer:
+    """Plants as a cellular automaton instead of one agent per plant, for the agents engine.
+
+    Each cell holds the number of plants of each size (0 to grow_time), and a last column for the
+    eatable plants. Every step, before the animals, the whole grid grows then makes cuttings like
+    Plant.step : a plant of size grow_time becomes eatable the step after, each plant drops a cutting
+    with the plants reproduction rate on a random cell of its Moore neighbourhood (center included),
+    the cutting survives competition with probability 1/(plants on that cell + 1) and only grows on
+    land above 0. Competition is computed from the plants of the start of the step, so results match
+    the Plant agents statistically, not draw for draw. Rabbits eat from the eatable column with consume.
+    With random activation, a Plant agent ripening during a step is only found by the rabbits activated
+    after it : plants ripening in the step get an activation time, and each rabbit one, like ripe_at
+    of the vectorized engine
+    """
+    def __init__(self, model, grow_time:int = 5):
+        """Empty layer, plants are added with add
+
+        Args:
+            model (ForagingModel): model of the layer, its map must already be generated
+            grow_time (int, optional): Time for a new plant to become edible (in nbr of steps). Defaults to 5.
+        """
+        self.model = model
+        self.grow_time = grow_time
+        self.height = model.grid.height
+        self.rng = model.rng
+        self.moore_center = model.grid.moore_center
+        #Number of plants of each size in each cell (cell = x*height + y), the last column are the eatable plants
+        self.sizes = np.zeros((model.grid.width*model.grid.height, grow_time + 2), dtype=np.int64)
+        #Cuttings don't grow in water
+        self.fertile = np.asarray(model.altitude).ravel() > 0
+        #Activation time of the plants ripening during a step : random, or the same for all with stages
+        #(0 if plants are activated before the rabbits, 1 after them)
+        self.ripening_time = None
+        if model.stages is not None and "rabbits" in model.stages:
+            plants_first = "plants" not in model.stages or model.stages.index("plants") < model.stages.index("rabbits")
+            self.ripening_time = 0. if plants_first else 1.
+        #Sorted activation times of the plants ripening this step and not eaten yet by cell, and activation
+        #time of the rabbits of this step, drawn when first needed
+        self.ripening = {}
+        self.activations = {}
+        if model.timer is not None:
+            model.timer.instrument(self, ["grow", "cuttings"])
+
+    @property
+    def counts(self):
+        """Number of plants of each cell
+        """
+        return self.sizes.sum(axis=1)
+
+    @property
+    def eatable(self):
+        """Number of eatable plants of each cell
+        """
+        return self.sizes[:, -1]
+
+    def count(self):
+        """Number of plants on the map
+        """
+        return int(self.sizes.sum())
+
+    def add(self, cells):
+        """New plants, of size 0
+
+        Args:
+            cells (np.ndarray): cell of each plant, a cell can appear several times
+        """
+        np.add.at(self.sizes[:, 0], cells, 1)
+
+    def step(self):
+        """Plant.grow then Plant.cuttings for every plant
+        """
+        self.grow()
+        self.cuttings()
+
+    def grow(self):
+        """Plants grow one size, plants of size grow_time become eatable
+        """
+        sizes = self.sizes
+        self.ripening = {}
+        self.activations = {}
+        if self.ripening_time != 0.:
+            cells = np.flatnonzero(sizes[:, -2])
+            counts = sizes[cells, -2]
+            if self.ripening_time is None:
+                times = np.split(self.rng.random(int(counts.sum())), np.cumsum(counts)[:-1])
+                self.ripening = {cell: sorted(cell_times) for cell, cell_times in zip(cells.tolist(), times)}
+            else :
+                self.ripening = {cell: [1.]*count for cell, count in zip(cells.tolist(), counts.tolist())}
+        sizes[:, -1] += sizes[:, -2]
+        sizes[:, 1:-1] = sizes[:, :-2]
+        sizes[:, 0] = 0
+
+    def cuttings(self):
+        """Asexual reproduction of all the plants at once
+        """
+        counts = self.counts
+        falls = self.rng.binomial(counts, self.model.p_reprod_rate)
+        parents = np.repeat(np.arange(len(counts)), falls)
+        #Where the cuttings fall
+        dispersion = self.moore_center[parents, self.rng.integers(0, 9, len(parents))]
+        #Competition from other plants and terrain
+        grows = (self.rng.random(len(dispersion)) < 1/(counts[dispersion] + 1)) & self.fertile[dispersion]
+        self.add(dispersion[grows])
+
+    def consume(self, pos:tuple, unique_id:int):
+        """A rabbit eats an eatable plant of a cell, if it finds one : plants ripening this step are only
+        found if they were activated before the rabbit. The latest one found is eaten first, the plants
+        found by fewer rabbits go first so as many rabbits as with Plant agents find one
+
+        Args:
+            pos (tuple): (x, y) position of the rabbit
+            unique_id (int): id of the rabbit, its activation time is the same for the whole step
+
+        Returns:
+            bool: True if a plant was eaten
+        """
+        cell = pos[0]*self.height + pos[1]
+        eatable = self.sizes[cell, -1]
+        if not eatable:
+            return False
+        ripening = self.ripening.get(cell)
+        if ripening:
+            activation = self.activations.get(unique_id)
+            if activation is None:
+                activation = self.activations[unique_id] = self.rng.random()
+            found = bisect_right(ripening, activation)
+            if found:
+                del ripening[found - 1]
+            elif eatable == len(ripening):
+                #Only plants activated after the rabbit
+                return False
+        self.sizes[cell, -1] -= 1
+        return True
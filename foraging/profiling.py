@@ -0,0 +1,110 @@
+from collections import defaultdict
+import time
+
+import pandas as pd
+
+
+class PhaseTimer:
+    """Wall time and number of calls of each phase (method) of each agent type.
+
+    Only agents created while the timer is on are instrumented, by wrapping their methods on the
+    instance : there is no overhead at all when the model doesn't profile. Times are inclusive (the
+    time of move includes the bonus feed after a downhill move), and recursive calls are counted but
+    only timed once, at the outermost call
+    """
+    def __init__(self):
+        #(agent type, phase): [seconds, calls], for the whole run and for the current step
+        self.totals = defaultdict(lambda: [0.0, 0])
+        self.current = defaultdict(lambda: [0.0, 0])
+        self.history = []
+        self._depth = defaultdict(int)
+
+    def instrument(self, obj, phases:list):
+        """Time some methods of an object from now on
+
+        Args:
+            obj (object): agent (or engine) to instrument
+            phases (list): names of the methods to time
+        """
+        kind = type(obj).__name__
+        for phase in phases:
+            setattr(obj, phase, self.wrap(getattr(obj, phase), kind, phase))
+
+    def wrap(self, method, kind:str, phase:str):
+        """Timed version of a bound method
+
+        Args:
+            method (callable): method to time
+            kind (str): agent type, first level of the results
+            phase (str): phase name, second level of the results
+
+        Returns:
+            callable: the wrapped method
+        """
+        key = (kind, phase)
+        current = self.current
+        depth = self._depth
+
+        def timed(*args, **kwargs):
+            depth[key] += 1
+            start = time.perf_counter()
+            try :
+                return method(*args, **kwargs)
+            finally :
+                depth[key] -= 1
+                record = current[key]
+                record[1] += 1
+                if depth[key] == 0:
+                    record[0] += time.perf_counter() - start
+        return timed
+
+    def record(self, kind:str, phase:str, seconds:float):
+        """Add a measure taken outside of the wrappers to the current step
+        """
+        record = self.current[(kind, phase)]
+        record[0] += seconds
+        record[1] += 1
+
+    def end_step(self, step:int):
+        """Close the current step : add it to the totals and the per-step history
+
+        Args:
+            step (int): number of the step that just ended
+        """
+        row = {"step": step}
+        for (kind, phase), (seconds, calls) in self.current.items():
+            row["{}.{}".format(kind, phase)] = seconds
+            row["{}.{}.calls".format(kind, phase)] = calls
+            self.totals[(kind, phase)][0] += seconds
+            self.totals[(kind, phase)][1] += calls
+        self.history.append(row)
+        #Reset in place, the wrappers hold a reference to this dict
+        for record in self.current.values():
+            record[0], record[1] = 0.0, 0
+
+    def get_steps_dataframe(self):
+        """Per-step breakdown, like the datacollector model vars
+
+        Returns:
+            pd.DataFrame: seconds and calls of each phase, one row per step
+        """
+        return pd.DataFrame(self.history).set_index("step").fillna(0)
+
+    def get_totals_dataframe(self):
+        """Cumulative time and calls of each phase over the run
+
+        Returns:
+            pd.DataFrame: seconds, calls, time per call and share of the total, by agent type and phase
+        """
+        totals = pd.DataFrame([(kind, phase, seconds, calls) for (kind, phase), (seconds, calls) in self.totals.items()],
+                columns = ["type", "phase", "seconds", "calls"]).set_index(["type", "phase"])
+        totals["us_per_call"] = 1e6*totals["seconds"]/totals["calls"].clip(lower=1)
+        #Share of the time spent in the model step (phases are nested in it)
+        step_time = totals["seconds"].get(("ForagingModel", "step"), totals["seconds"].sum())
+        totals["share"] = totals["seconds"]/step_time
+        return totals.sort_values("seconds", ascending=False)
+
+    def summary(self):
+        """Text table of the cumulative times, to print at the end of a run
+        """
+        return self.get_totals_dataframe().to_string(float_format = lambda value: "{:.4f}".format(value))
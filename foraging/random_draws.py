@@ -0,0 +1,64 @@
+class RandomStream:
+    """Uniform random numbers drawn in blocks from a NumPy generator and consumed one at a time, as Python floats.
+    Offers the few methods of the random module the agents need
+    """
+    def __init__(self, rng, block_size:int = 64):
+        self.rng = rng
+        self.block_size = block_size
+        self._values = []
+        self._cursor = 0
+
+    def refill(self, size:int):
+        """Draw a new block of numbers, dropping what's left of the previous one
+
+        Args:
+            size (int): number of values to draw
+        """
+        self._values = self.rng.random(max(size, self.block_size)).tolist()
+        self._cursor = 0
+
+    def random(self):
+        """Next float in [0, 1)
+        """
+        if self._cursor == len(self._values):
+            self.refill(len(self._values))
+        value = self._values[self._cursor]
+        self._cursor += 1
+        return value
+
+    def randrange(self, n:int):
+        """Next integer in [0, n)
+        """
+        return int(self.random()*n)
+
+    def choice(self, seq):
+        """Random element of a non-empty sequence
+        """
+        return seq[self.randrange(len(seq))]
+
+
+class RandomDraws:
+    """One random stream per decision of the agents, all drawn from the model generator.
+    The model refills every stream with a block sized on the number of agents at the start of
+    each step, so a run is the same from one seed whatever the machine or the process
+    """
+    def __init__(self, rng):
+        #Plant.cuttings and sexual_reprod success
+        self.reproduction = RandomStream(rng)
+        #Survival of a cutting to competition
+        self.seed = RandomStream(rng)
+        #Sex of newborns
+        self.sex = RandomStream(rng)
+        #Where animals move and cuttings fall
+        self.move = RandomStream(rng)
+        #Which cellmate is eaten, or gets a carrot
+        self.choice = RandomStream(rng)
+
+    def refill(self, size:int):
+        """Pre-draw the blocks of a step
+
+        Args:
+            size (int): expected number of draws of each stream, the number of agents
+        """
+        for stream in (self.reproduction, self.seed, self.sex, self.move, self.choice):
+            stream.refill(size)
@@ -0,0 +1,196 @@
+from collections import defaultdict
+
+from mesa import Agent
+from mesa.time import RandomActivation
+
+#Activation lists are compacted when the agents removed from them pass this fraction of their length
+COMPACT_FRACTION = 0.25
+
+
+class SpeciesRegistry:
+    """Per-species population counters, kept up to date when agents are added to or removed from
+    the schedule, so the datacollector never has to scan all the agents
+    """
+    def __init__(self):
+        #number of agents and sum of their health, by agent class
+        self.counts = defaultdict(int)
+        self.health_sums = defaultdict(int)
+
+    def add(self, agent):
+        """Register a new agent
+
+        Args:
+            agent (mesa agent): agent added to the schedule
+        """
+        species = type(agent)
+        self.counts[species] += 1
+        self.health_sums[species] += getattr(agent, "health", 0)
+
+    def remove(self, agent):
+        """Unregister an agent
+
+        Args:
+            agent (mesa agent): agent removed from the schedule
+        """
+        species = type(agent)
+        self.counts[species] -= 1
+        self.health_sums[species] -= getattr(agent, "health", 0)
+
+    def update_health(self, agent, delta:int):
+        """Keep the running health sum up to date when the health of an agent changes
+
+        Args:
+            agent (mesa agent): agent whose health changed
+            delta (int): new health minus old health
+        """
+        self.health_sums[type(agent)] += delta
+
+    def count(self, species):
+        """Number of living agents of a species
+
+        Args:
+            species (class): agent class (Rabbit, Plant, Fox)
+
+        Returns:
+            int: population size
+        """
+        return self.counts[species]
+
+    def average_health(self, species):
+        """Average health of a species, 0 if the species is extinct
+
+        Args:
+            species (class): agent class (Rabbit, Fox)
+
+        Returns:
+            float: average health
+        """
+        count = self.counts[species]
+        if count == 0:
+            return 0
+        return self.health_sums[species] / count
+
+    def check(self, agents):
+        """Cross-check the counters against a full scan of the agents, for debugging
+
+        Args:
+            agents (list): all the agents of the schedule
+
+        Raises:
+            ValueError: Error if a counter is out of sync with the agents
+        """
+        counts = defaultdict(int)
+        health_sums = defaultdict(int)
+        for agent in agents:
+            counts[type(agent)] += 1
+            health_sums[type(agent)] += getattr(agent, "health", 0)
+        for species in set(counts) | set(self.counts):
+            if counts[species] != self.counts[species] or health_sums[species] != self.health_sums[species]:
+                raise ValueError("Registry out of sync for {} : {} agents (health {}) counted, {} (health {}) scanned".format(
+                    species.__name__, self.counts[species], self.health_sums[species], counts[species], health_sums[species]))
+
+
+class RegistryActivation(RandomActivation):
+    """Random activation that keeps the model species registry up to date.
+    Every birth, death, carrot extraction and predation goes through add/remove
+    """
+    def add(self, agent):
+        super().add(agent)
+        self.model.registry.add(agent)
+
+    def remove(self, agent):
+        super().remove(agent)
+        self.model.registry.remove(agent)
+
+
+class SpeciesActivation(RegistryActivation):
+    """Scheduler activating the agents species after species, in a fixed order of stages, and in
+    random order inside each stage. Each species has its own activation list, shuffled in place
+    every step : agents born during a stage wait for the next step, agents removed are skipped and
+    stay in their list until they pass COMPACT_FRACTION of it, the list is then rebuilt at its next
+    stage. Passive agents, whose class doesn't define a step, are scheduled (and counted by the
+    registry) but never activated
+    """
+    def __init__(self, model, stages:list):
+        """Create an empty scheduler
+
+        Args:
+            model (mesa model): model of the agents
+            stages (list): agent classes in activation order, species not listed are never activated
+        """
+        super().__init__(model)
+        self.stages = [species for species in stages if species.step is not Agent.step]
+        #Activation list, and unique ids of the agents removed but still in it, by species
+        self._species = defaultdict(list)
+        self._removed = defaultdict(set)
+
+    def add(self, agent):
+        species = type(agent)
+        if agent.unique_id in self._removed[species]:
+            #Removed then added back before the list was compacted, it would appear twice
+            self._compact(species)
+        super().add(agent)
+        self._species[species].append(agent)
+
+    def remove(self, agent):
+        super().remove(agent)
+        self._removed[type(agent)].add(agent.unique_id)
+
+    @property
+    def agents(self):
+        #Living agents in activation list order
+        return [agent for species, agents in self._species.items() for agent in agents
+                if agent.unique_id not in self._removed[species]]
+
+    def activation_lists(self):
+        """Unique ids of the activation lists, removed agents included, for checkpoints : resuming
+        from the same lists gives the same shuffles
+
+        Returns:
+            dict: species:(ids in list order, ids of the removed agents)
+        """
+        return {species: ([agent.unique_id for agent in agents], sorted(self._removed[species]))
+                for species, agents in self._species.items()}
+
+    def restore_activation_lists(self, lists:dict, agents:dict):
+        """Rebuild the activation lists of activation_lists, once the living agents are added back
+
+        Args:
+            lists (dict): species:(ids in list order, ids of the removed agents)
+            agents (dict): living agents by unique id
+        """
+        for species, (order, removed) in lists.items():
+            self._species[species] = [agents[unique_id] if unique_id in agents else _RemovedAgent(unique_id)
+                    for unique_id in order]
+            self._removed[species] = set(removed)
+
+    def step(self):
+        for species in self.stages:
+            agents = self._species[species]
+            removed = self._removed[species]
+            if len(removed) > COMPACT_FRACTION*len(agents):
+                self._compact(species)
+            self.model.random.shuffle(agents)
+            #The length is read once, newborns appended during the stage are not activated
+            for i in range(len(agents)):
+                agent = agents[i]
+                if agent.unique_id not in removed:
+                    agent.step()
+        self.steps += 1
+        self.time += 1
+
+    def _compact(self, species):
+        removed = self._removed[species]
+        if removed:
+            agents = self._species[species]
+            agents[:] = [agent for agent in agents if agent.unique_id not in removed]
+            removed.clear()
+
+
+class _RemovedAgent:
+    """Place of a removed agent in a restored activation list, only its id is needed
+    """
+    __slots__ = ("unique_id",)
+
+    def __init__(self, unique_id:int):
+        self.unique_id = unique_id
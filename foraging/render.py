@@ -0,0 +1,189 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from agents import Rabbit, Plant, Fox
+
+WATER = (0, 0, 255)
+#Drawing order, color and size (fraction of the cell) of the markers, nested so all of them stay visible
+MARKERS = [
+    (Plant, (0, 128, 0), 0.9),
+    (Rabbit, (255, 0, 0), 0.6),
+    (Fox, (255, 255, 0), 0.3),
+]
+#Animations Pillow can write, other video formats need imageio
+PILLOW_ANIMATIONS = (".gif", ".webp")
+
+
+def altitude_shade(altitude):
+    #Approx returns an HTML code for a shade of grey depending on altitude, I stay in decimal base because I'm lazy
+    html_shade = "#"+str(int(100 -(altitude)))*3
+    return html_shade
+
+
+def html_to_rgb(color:str):
+    """RGB values of an HTML color code, "#rrggbb" or "#rgb"
+    """
+    digits = color.lstrip("#")
+    if len(digits) == 3:
+        digits = "".join(digit*2 for digit in digits)
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def terrain_rgb(altitude):
+    """Colors of the terrain of the web visualization : altitude_shade on land, blue in water
+
+    Args:
+        altitude (np.ndarray): altitudes, indexed by (x, y)
+
+    Returns:
+        np.ndarray: (width, height, 3) uint8 colors
+    """
+    altitude = np.asarray(altitude)
+    #altitude_shade of every whole altitude of the land, 100 - altitude is between 0 and 99
+    shades = np.array([html_to_rgb(altitude_shade(value)) for value in range(1, 101)], dtype=np.uint8)
+    colors = shades[np.clip(altitude.astype(np.int64), 1, 100) - 1]
+    colors[altitude <= 0] = WATER
+    return colors
+
+
+class Rasterizer:
+    """Headless renderer of a ForagingModel : draws the terrain and the plant, rabbit and fox markers
+    straight into a NumPy RGB image, with the orientation of the web visualization (y = 0 at the bottom).
+    Works with both engines and the plant layer. The terrain is only shaded once per map
+    """
+    def __init__(self, scale:int = None, size:int = 500):
+        """Initialize the renderer
+
+        Args:
+            scale (int, optional): pixels per cell. Defaults to None, the most that fits in size.
+            size (int, optional): largest side of the image in pixels, when scale is None. Defaults to 500.
+        """
+        self.scale = scale
+        self.size = size
+        self._terrain = None
+        self._background = None
+
+    def render(self, model):
+        """Draw the current state of a model
+
+        Args:
+            model (ForagingModel): model to draw
+
+        Returns:
+            np.ndarray: (height*scale, width*scale, 3) uint8 image
+        """
+        scale = self.scale or max(1, self.size // max(model.grid.width, model.grid.height))
+        if self._terrain is not model.altitude or self._background.shape[0] != model.grid.width*scale:
+            self._terrain = model.altitude
+            self._background = np.repeat(np.repeat(terrain_rgb(model.altitude), scale, axis=0), scale, axis=1)
+        width, height = model.grid.width, model.grid.height
+        image = self._background.copy()
+        #One (scale, scale) tile per cell, markers are only written on the occupied cells
+        tiles = image.reshape(width, scale, height, scale, 3)
+        for species, color, size in MARKERS:
+            x, y = self.positions(model, species)
+            start, end = self._stamp(scale, size)
+            tiles[x, start:end, y, start:end] = color
+        #(x, y) to rows from the top of the image
+        return image.transpose(1, 0, 2)[::-1]
+
+    def positions(self, model, species):
+        """Positions of the individuals of a species, or of the cells with plants for the plant layer
+
+        Returns:
+            tuple: (x, y) arrays
+        """
+        if species is Plant and model.plant_layer is not None:
+            return np.divmod(np.flatnonzero(model.plant_layer.counts), model.grid.height)
+        if model.engine == "vectorized":
+            return model.schedule.positions(species)
+        positions = [agent.pos for agent in model.schedule.agents if type(agent) is species]
+        if not positions:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return tuple(np.array(positions).T)
+
+    def _stamp(self, scale:int, size:float):
+        #First and last pixel (excluded) of the centered square marker of a cell, at least one pixel wide
+        side = max(1, int(round(scale*size)))
+        start = (scale - side)//2
+        return start, start + side
+
+
+class FrameWriter:
+    """Writes rendered frames as numbered PNG files in a folder, or as an animation or video file :
+    .gif and .webp are written with Pillow (frames are kept until close), other extensions such as .mp4 need imageio
+    """
+    def __init__(self, path:str, fps:int = 10):
+        """Open the output
+
+        Args:
+            path (str): folder of the PNG frames, or animation/video file
+            fps (int, optional): frames per second of animations and videos. Defaults to 10.
+
+        Raises:
+            ImportError: Error if the video format needs imageio and it isn't installed
+        """
+        self.path = path
+        self.fps = fps
+        self.extension = os.path.splitext(path)[1].lower()
+        self._frames = []
+        self._video = None
+        if not self.extension:
+            os.makedirs(path, exist_ok=True)
+        elif self.extension not in PILLOW_ANIMATIONS:
+            try :
+                import imageio
+            except ImportError:
+                raise ImportError("Writing {} videos needs imageio (and imageio-ffmpeg), use a .gif or a folder of PNG frames".format(
+                        self.extension))
+            self._video = imageio.get_writer(path, fps=fps)
+
+    def write(self, frame, step:int):
+        """Add a frame
+
+        Args:
+            frame (np.ndarray): image of Rasterizer.render
+            step (int): step of the model, names the PNG file
+        """
+        if not self.extension:
+            Image.fromarray(frame).save(os.path.join(self.path, "frame_{:06d}.png".format(step)))
+        elif self._video is not None:
+            self._video.append_data(frame)
+        else :
+            self._frames.append(Image.fromarray(frame))
+
+    def close(self):
+        """Finish the animation or video file
+        """
+        if self._video is not None:
+            self._video.close()
+        elif self._frames:
+            self._frames[0].save(self.path, save_all=True, append_images=self._frames[1:],
+                    duration=int(1000/self.fps), loop=0)
+            self._frames = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def render_checkpoints(paths:list, output:str, fps:int = 10, scale:int = None):
+    """Render a run afterwards, from snapshots saved along the way (see ForagingModel.save)
+
+    Args:
+        paths (list): .npz snapshots, in step order
+        output (str): folder of PNG frames, or animation/video file
+        fps (int, optional): frames per second of animations and videos. Defaults to 10.
+        scale (int, optional): pixels per cell. Defaults to None, fits in 500 pixels.
+    """
+    from model import ForagingModel
+
+    rasterizer = Rasterizer(scale)
+    with FrameWriter(output, fps) as writer:
+        for path in paths:
+            model = ForagingModel.load(path, silent=True)
+            writer.write(rasterizer.render(model), model.schedule.steps)
@@ -1,10 +1,15 @@
 from agents import Rabbit, Plant, Fox
 from model import ForagingModel, compute_population_r, compute_population_p, compute_population_f
-from mesa.batchrunner import BatchRunner
+from batch import ParallelBatchRunner
+from render import Rasterizer, FrameWriter
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+import os
 
 
-def batch_run(graphics:bool, steps:int = 20):
+def batch_run(graphics:bool, steps:int = 20, processes:int = None, seed:int = None, stop_conditions:dict = None):
     #######
     #Run a batch of models
     #######
@@ -16,11 +21,14 @@ def batch_run(graphics:bool, steps:int = 20):
         "P" : 15,
         "F" : 5
         }
+    if stop_conditions:
+        #Runs end early, the results get the stop reason and step
+        fixed_params["stop_conditions"] = stop_conditions
     #Variable number of rabbits
     variable_params = {"R": range(10, 30, 5)}
 
-    #Batch running instanciation
-    batch_run = BatchRunner(
+    #Batch running instanciation, runs are spread over all the cores
+    batch_run = ParallelBatchRunner(
             ForagingModel,
             variable_params,
             fixed_params,
@@ -29,7 +37,9 @@ def batch_run(graphics:bool, steps:int = 20):
             model_reporters={
                 "Rabbits": compute_population_r,
                 "Plants": compute_population_p,
-                "Foxes" : compute_population_f}
+                "Foxes" : compute_population_f},
+            processes=processes,
+            seed=seed
         )
 
     batch_run.run_all()
@@ -43,17 +53,89 @@ def batch_run(graphics:bool, steps:int = 20):
         plt.scatter(run_data.R, run_data.Rabbits)
         plt.show()
 
-def run(graphics:bool, steps:int, R:int, P:int, F:int, width:int, height:int):
-    model = ForagingModel(R, P, F, width, height)
-    for i in range(steps):
-            model.step()
-    data = model.datacollector.get_model_vars_dataframe()
-    data.Rabbits.plot()
-    data.Plants.plot()
-    #data.Foxes.plot()
+def run(graphics:bool, steps:int, R:int, P:int, F:int, width:int, height:int, 
+        collector_path:str = None, collect_interval:int = 1, checkpoint_path:str = None, checkpoint_interval:int = 1000,
+        profile:bool = False, stop_conditions:dict = None, render_path:str = None, render_every:int = 1):
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        #Resume an interrupted run from its last snapshot
+        model = ForagingModel.load(checkpoint_path, checkpoint_path = checkpoint_path, checkpoint_interval = checkpoint_interval,
+                profile = profile)
+    else :
+        model = ForagingModel(R, P, F, width, height, collector_path = collector_path, collect_interval = collect_interval,
+                checkpoint_path = checkpoint_path, checkpoint_interval = checkpoint_interval, profile = profile,
+                stop_conditions = stop_conditions)
+    #Headless frames of every render_every steps, as PNG files in a folder or an animation/video file
+    writer = FrameWriter(render_path) if render_path is not None else None
+    rasterizer = Rasterizer()
+    #Stops early if a stop condition is met
+    while model.running and model.schedule.steps < steps:
+        model.step()
+        if writer is not None and model.schedule.steps % render_every == 0:
+            writer.write(rasterizer.render(model), model.schedule.steps)
+    if writer is not None:
+        writer.close()
+    if model.stop_reason is not None:
+        print("Stopped at step {} : {}".format(model.stop_step, model.stop_reason))
+    if profile:
+        print(model.timer.summary())
+    if collector_path is None:
+        data = model.datacollector.get_model_vars_dataframe()
+        data.Rabbits.plot()
+        data.Plants.plot()
+        #data.Foxes.plot()
+    else:
+        #Read back from disk chunk by chunk
+        model.datacollector.reader().plot(["Rabbits", "Plants"])
     plt.show()
 
+def compare_engines(graphics:bool, steps:int, R:int, P:int, F:int, width:int, height:int, runs:int = 10, seed:int = None):
+    """Run both engines of the model several times with the same parameters, to check that
+    the vectorized engine gives statistically the same population trajectories as the agents.
+    Each population is compared at each step with a Welch t test between the runs of both engines
 
+    Args:
+        graphics (bool): plot mean trajectories of both engines
+        steps (int): number of steps of each run
+        runs (int, optional): number of runs per engine. Defaults to 10.
+        seed (int, optional): seed from which the seed of every run is derived, so the comparison
+            can be repeated. Defaults to None.
+
+    Returns:
+        tuple: (pd.DataFrame of the mean and standard deviation of each population, by engine and step,
+            pd.DataFrame of the p-values of the Welch t tests, by step and population)
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(runs)
+    species = ["Rabbits", "Plants", "Foxes"]
+    trajectories = []
+    for engine in ["agents", "vectorized"]:
+        for run_seed in seeds:
+            model = ForagingModel(R, P, F, width, height, engine = engine, seed = int(run_seed), silent = True)
+            for j in range(steps):
+                model.step()
+            data = model.datacollector.get_model_vars_dataframe()[species]
+            data["engine"] = engine
+            data["step"] = range(len(data))
+            trajectories.append(data)
+    trajectories = pd.concat(trajectories)
+    summary = trajectories.groupby(["engine", "step"]).agg(["mean", "std"])
+
+    #Runs of an engine as a (runs, steps) array per population, nan p-values where both engines have no variance
+    by_engine = {engine: data.sort_values("step", kind = "stable") for engine, data in trajectories.groupby("engine")}
+    rows = len(by_engine["agents"])//runs
+    pvalues = pd.DataFrame(index = pd.RangeIndex(rows, name = "step"))
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        for population in species:
+            agents, vectorized = [by_engine[engine][population].to_numpy().reshape(rows, runs).T
+                    for engine in ["agents", "vectorized"]]
+            pvalues[population] = stats.ttest_ind(agents, vectorized, equal_var = False, axis = 0).pvalue
+
+    if graphics:
+        for population in species:
+            for engine in ["agents", "vectorized"]:
+                summary.loc[engine][(population, "mean")].plot(label = "{} ({})".format(population, engine))
+            plt.legend()
+            plt.show()
+    return summary, pvalues
 
 
 if __name__=="__main__":
@@ -0,0 +1,216 @@
+from collections import defaultdict
+import functools
+
+from mesa.space import MultiGrid
+import numpy as np
+
+#Kinds of move to a neighbouring cell : into water (not allowed), uphill or flat, downhill (bonus actions)
+BLOCKED, STEP, DOWNHILL = 0, 1, 2
+
+
+@functools.lru_cache(maxsize=8)
+def moore_table(width:int, height:int, include_center:bool = False):
+    """Moore neighbourhood of every cell of a toroidal grid, computed once per grid size.
+    Cells are indexed by x*height + y, and each row is sorted like the neighbourhoods of
+    mesa get_neighborhood, so sampling a column gives the same cell as sampling that list
+
+    Args:
+        width (int): width of the grid
+        height (int): height of the grid
+        include_center (bool, optional): include the cell itself. Defaults to False.
+
+    Raises:
+        ValueError: Error if the grid is smaller than 3x3, neighbours would wrap onto each other
+
+    Returns:
+        np.ndarray: read-only (width*height, 8 or 9) array of cell indices
+    """
+    if width < 3 or height < 3:
+        raise ValueError("Neighbourhood tables need a grid of at least 3x3 cells")
+    offsets = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if include_center or (dx, dy) != (0, 0)]
+    x, y = np.divmod(np.arange(width*height), height)
+    table = np.stack([((x + dx) % width)*height + (y + dy) % height for dx, dy in offsets], axis=1)
+    table.sort(axis=1)
+    table = table.astype(np.int32 if width*height < 2**31 else np.int64)
+    table.flags.writeable = False
+    return table
+
+
+def transition_table(altitude, neighbours):
+    """Kind of move from every cell to each of its neighbours, derived from the altitude layer
+
+    Args:
+        altitude (np.ndarray): altitude of the cells, indexed by (x, y)
+        neighbours (np.ndarray): neighbourhood table of moore_table
+
+    Returns:
+        np.ndarray: read-only int8 array of BLOCKED, STEP or DOWNHILL, same shape as neighbours
+    """
+    altitude = np.asarray(altitude).ravel()
+    target = altitude[neighbours]
+    transitions = np.full(neighbours.shape, STEP, dtype=np.int8)
+    transitions[target < altitude[:, None]] = DOWNHILL
+    transitions[target < 0] = BLOCKED
+    transitions.flags.writeable = False
+    return transitions
+
+
+class IndexedMultiGrid(MultiGrid):
+    """MultiGrid keeping a spatial index of its cells : the agents of each species in each cell
+    (in the order of the cell list), and the numbers of eatable agents and of agents of each sex.
+    The index is updated whenever an agent is placed, moved or removed, so cellmate queries
+    don't scan and filter the cell contents.
+
+    Species are agent types, the sex of an agent is its `sex` attribute when it has one and an agent
+    is eatable when its `eatable` attribute is true : an agent that becomes eatable while on the grid
+    must call set_eatable
+
+    On a torus, the Moore neighbourhoods of all the cells are precomputed as tables of cell indices
+    (moore and moore_center, shared with the vectorized engine), and agents draw their neighbours
+    with random_neighbour instead of get_neighborhood
+    """
+    def __init__(self, width:int, height:int, torus:bool):
+        super().__init__(width, height, torus)
+        if torus:
+            self.moore = moore_table(width, height)
+            self.moore_center = moore_table(width, height, True)
+        #Python copies of the tables for the agents, built on first use
+        self._rows = {}
+        #(pos, species): agents, in the order of the cell
+        self._species = defaultdict(list)
+        #(pos, species): number of eatable agents
+        self._eatable = defaultdict(int)
+        #(pos, species, sex): number of agents
+        self._sexes = defaultdict(int)
+
+    def _place_agent(self, pos, agent):
+        super()._place_agent(pos, agent)
+        species = type(agent)
+        bucket = self._species[(pos, species)]
+        if agent in bucket:
+            return
+        bucket.append(agent)
+        sex = getattr(agent, "sex", None)
+        if sex is not None:
+            self._sexes[(pos, species, sex)] += 1
+        if getattr(agent, "eatable", False):
+            self._eatable[(pos, species)] += 1
+
+    def _remove_agent(self, pos, agent):
+        super()._remove_agent(pos, agent)
+        species = type(agent)
+        self._species[(pos, species)].remove(agent)
+        sex = getattr(agent, "sex", None)
+        if sex is not None:
+            self._sexes[(pos, species, sex)] -= 1
+        if getattr(agent, "eatable", False):
+            self._eatable[(pos, species)] -= 1
+
+    def random_neighbour(self, pos, stream, include_center:bool = False):
+        """Random cell of the Moore neighbourhood of a position
+
+        Args:
+            pos (tuple): (x, y) position on the grid
+            stream (RandomStream): random stream drawing the neighbour
+            include_center (bool, optional): the position itself can be drawn. Defaults to False.
+
+        Returns:
+            tuple: (x, y) position of the neighbour
+        """
+        rows = self._rows.get(include_center)
+        if rows is None:
+            rows = self._rows[include_center] = self.position_rows(self.moore_center if include_center else self.moore)
+        x, y = pos
+        return stream.choice(rows[x*self.height + y])
+
+    def position_rows(self, table, values = None):
+        """Python copy of a table of cell indices (one row per cell, cell = x*height + y) as lists of
+        (x, y) positions, for the agents reading one entry at a time : Python lists are much faster to
+        read one item at a time than NumPy arrays
+
+        Args:
+            table (np.ndarray): (cells, k) cell indices, like moore
+            values (np.ndarray, optional): (cells, k) values paired with the positions. Defaults to None.
+
+        Returns:
+            list: for each cell, its list of (x, y) positions, or of (position, value) pairs with values
+        """
+        coordinates = [(x, y) for x in range(self.width) for y in range(self.height)]
+        if values is None:
+            return [[coordinates[cell] for cell in row] for row in table.tolist()]
+        return [[(coordinates[cell], value) for cell, value in zip(cells, row_values)]
+                for cells, row_values in zip(table.tolist(), values.tolist())]
+
+    def set_eatable(self, agent, eatable:bool):
+        """Update the index when an agent on the grid becomes eatable, or stops being eatable.
+        To be called before changing the attribute
+
+        Args:
+            agent (mesa agent): agent placed on the grid
+            eatable (bool): new state
+        """
+        if eatable != bool(getattr(agent, "eatable", False)):
+            self._eatable[(agent.pos, type(agent))] += 1 if eatable else -1
+
+    def get_species(self, pos, species):
+        """Agents of a species in a cell
+
+        Args:
+            pos (tuple): (x, y) position on the grid
+            species (class): agent type
+
+        Returns:
+            list: the agents, in the order of the cell contents. Not a copy, don't modify it
+        """
+        return self._species.get((pos, species), [])
+
+    def count_species(self, pos, species):
+        """Number of agents of a species in a cell
+        """
+        return len(self._species.get((pos, species), ()))
+
+    def get_eatable(self, pos, species):
+        """Eatable agents of a species in a cell, only scans the cell when there is one
+
+        Returns:
+            list: the agents, in the order of the cell contents
+        """
+        if not self._eatable.get((pos, species), 0):
+            return []
+        return [agent for agent in self._species[(pos, species)] if agent.eatable]
+
+    def count_eatable(self, pos, species):
+        """Number of eatable agents of a species in a cell
+        """
+        return self._eatable.get((pos, species), 0)
+
+    def count_sex(self, pos, species, sex:bool):
+        """Number of agents of a species and a sex in a cell
+        """
+        return self._sexes.get((pos, species, sex), 0)
+
+    def check(self):
+        """Cross-check the index against a full scan of the cells, for debugging
+
+        Raises:
+            ValueError: Error if a bucket or a counter is out of sync with the cell contents
+        """
+        species_buckets = defaultdict(list)
+        eatable = defaultdict(int)
+        sexes = defaultdict(int)
+        for cell, x, y in self.coord_iter():
+            for agent in cell:
+                species = type(agent)
+                species_buckets[((x, y), species)].append(agent)
+                if getattr(agent, "sex", None) is not None:
+                    sexes[((x, y), species, agent.sex)] += 1
+                if getattr(agent, "eatable", False):
+                    eatable[((x, y), species)] += 1
+        for scanned, index, name in ((species_buckets, self._species, "species"), (eatable, self._eatable, "eatable"),
+                (sexes, self._sexes, "sex")):
+            #Empty buckets and null counters are left in the index
+            index = {key: value for key, value in index.items() if value}
+            for key in set(scanned) | set(index):
+                if scanned.get(key) != index.get(key):
+                    raise ValueError("Grid index out of sync ({}) in {} : {} indexed, {} scanned".format(
+                        name, key, index.get(key), scanned.get(key)))
@@ -0,0 +1,81 @@
+import numpy as np
+
+
+class StopConditions:
+    """Conditions ending a run before its last step : extinction of any or all of the watched
+    species, a species exceeding a population cap, or populations reaching a steady state.
+
+    Steady state is tested over a sliding window of the last populations : the window is split in two
+    halves, and the run is steady when, for every watched species, the difference between the means of
+    the halves is within the noise of the window (below z standard errors) or negligible (below tolerance
+    times the mean). A trend or a transient fails the test, fluctuations around a level pass it
+    """
+    def __init__(self, species:list = ("plants", "rabbits", "foxes"), extinction:str = None, max_population:int = None,
+            steady_window:int = None, steady_tolerance:float = 0.01, steady_z:float = 2):
+        """Initialize the conditions, all off by default
+
+        Args:
+            species (list, optional): species watched. Defaults to ("plants", "rabbits", "foxes").
+            extinction (str, optional): "any" to stop when one of the species dies out, "all" when they all do. Defaults to None.
+            max_population (int, optional): stop when a species exceeds this population. Defaults to None.
+            steady_window (int, optional): number of steps of the steady state window, None to never test it. Defaults to None.
+            steady_tolerance (float, optional): relative difference of the half-window means always seen as steady. Defaults to 0.01.
+            steady_z (float, optional): difference of the half-window means, in standard errors, seen as noise. Defaults to 2.
+
+        Raises:
+            ValueError: Error if extinction is not "any" or "all", or the window is shorter than 4 steps
+        """
+        if extinction not in (None, "any", "all"):
+            raise ValueError("Extinction condition must be 'any' or 'all', not {}".format(extinction))
+        if steady_window is not None and steady_window < 4:
+            raise ValueError("Steady state window must be at least 4 steps")
+        #Arguments, saved with the checkpoints
+        self.params = {"species": list(species), "extinction": extinction, "max_population": max_population,
+                "steady_window": steady_window, "steady_tolerance": steady_tolerance, "steady_z": steady_z}
+        self.species = list(species)
+        self.extinction = extinction
+        self.max_population = max_population
+        self.steady_window = steady_window
+        self.steady_tolerance = steady_tolerance
+        self.steady_z = steady_z
+        #Ring buffer of the last populations, one column per species
+        self.window = np.zeros((steady_window or 0, len(self.species)))
+        self.recorded = 0
+
+    def check(self, populations:dict):
+        """Record the populations of a step and test the conditions
+
+        Args:
+            populations (dict): population by species name
+
+        Returns:
+            str: reason to stop ("extinction", "max_population" or "steady_state"), None to go on
+        """
+        sizes = np.array([populations[species] for species in self.species], dtype=np.float64)
+        if self.extinction == "any" and (sizes == 0).any():
+            return "extinction"
+        if self.extinction == "all" and (sizes == 0).all():
+            return "extinction"
+        if self.max_population is not None and (sizes > self.max_population).any():
+            return "max_population"
+        if self.steady_window:
+            self.window[self.recorded % self.steady_window] = sizes
+            self.recorded += 1
+            if self.recorded >= self.steady_window and self.steady():
+                return "steady_state"
+        return None
+
+    def steady(self):
+        """Test the steady state over a full window
+
+        Returns:
+            bool: True if no species drifts over the window
+        """
+        #Oldest first
+        window = np.roll(self.window, -(self.recorded % self.steady_window), axis=0)
+        half = self.steady_window // 2
+        first, last = window[:half], window[-half:]
+        drift = np.abs(last.mean(axis=0) - first.mean(axis=0))
+        noise = np.sqrt((first.var(axis=0, ddof=1) + last.var(axis=0, ddof=1))/half)
+        level = (first.mean(axis=0) + last.mean(axis=0))/2
+        return bool(((drift <= self.steady_z*noise) | (drift <= self.steady_tolerance*level)).all())
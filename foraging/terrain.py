@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy.ndimage import gaussian_filter #to smoothe the map
+
+from atomic import write_atomic
+
+#Bounds of the random altitudes before smoothing, negative values are water
+ALTITUDE_RANGE = (-30, 100)
+TRUNCATE = 1.5
+LAYERS = ("altitude", "land", "slope")
+
+
+def terrain_layers(altitude):
+    """Layers derived from an altitude map
+
+    Args:
+        altitude (np.ndarray): altitudes, indexed by (x, y)
+
+    Returns:
+        dict: land (bool, cells animals can walk on) and slope (float, norm of the altitude gradient,
+            computed across the edges of the torus)
+    """
+    altitude = np.asarray(altitude, dtype=np.float64)
+    dx = (np.roll(altitude, -1, axis=0) - np.roll(altitude, 1, axis=0))/2
+    dy = (np.roll(altitude, -1, axis=1) - np.roll(altitude, 1, axis=1))/2
+    return {"land": altitude >= 0, "slope": np.hypot(dx, dy)}
+
+
+def generate_terrain(width:int, height:int, seed:int, sigma:float = 0.8):
+    """Random smooth terrain : uniform altitudes smoothed by a gaussian filter, and the layers derived from it
+
+    Args:
+        width (int): width of the map
+        height (int): height of the map
+        seed (int): seed of the terrain, the same seed always gives the same map
+        sigma (float, optional): standard deviation of the gaussian filter. Defaults to 0.8.
+
+    Returns:
+        dict: altitude, land and slope arrays, indexed by (x, y)
+    """
+    rng = np.random.default_rng(seed)
+    altitude = rng.integers(*ALTITUDE_RANGE, size=(width, height))
+    altitude = gaussian_filter(altitude, sigma=sigma, truncate=TRUNCATE)
+    return {"altitude": altitude, **terrain_layers(altitude)}
+
+
+def terrain_key(width:int, height:int, sigma:float, seed:int):
+    """Content address of a terrain in the cache, a hash of everything the map depends on
+    """
+    description = json.dumps({"width": width, "height": height, "sigma": sigma, "seed": seed,
+            "range": ALTITUDE_RANGE, "truncate": TRUNCATE})
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def load_terrain(width:int, height:int, seed:int, sigma:float = 0.8, cache_dir:str = None):
+    """Terrain of generate_terrain, read from the cache when it was already generated.
+    Cached layers are .npy files memory-mapped read-only, several models (or processes) on the
+    same map share them instead of generating and holding one copy each
+
+    Args:
+        width (int): width of the map
+        height (int): height of the map
+        seed (int): seed of the terrain
+        sigma (float, optional): standard deviation of the gaussian filter. Defaults to 0.8.
+        cache_dir (str, optional): folder of the cache, no cache if None. Defaults to None.
+
+    Returns:
+        dict: altitude, land and slope arrays, indexed by (x, y)
+    """
+    if cache_dir is None:
+        return generate_terrain(width, height, seed, sigma)
+    folder = os.path.join(cache_dir, terrain_key(width, height, sigma, seed))
+    if not os.path.isdir(folder):
+        terrain = generate_terrain(width, height, seed, sigma)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        def write(temporary):
+            for layer in LAYERS:
+                np.save(os.path.join(temporary, layer + ".npy"), terrain[layer])
+
+        #Another process caching the same terrain first keeps its folder
+        write_atomic(folder, write, directory=True)
+    return {layer: np.load(os.path.join(folder, layer + ".npy"), mmap_mode="r") for layer in LAYERS}
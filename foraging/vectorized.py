@@ -0,0 +1,353 @@
+import numpy as np
+
+from agents import Rabbit, Plant, Fox
+from space import BLOCKED, DOWNHILL
+
+
+class VectorizedSchedule:
+    """Structure-of-arrays engine for the ForagingModel.
+
+    Rabbits, foxes and plants are not mesa agents but columns of NumPy arrays (position, sex,
+    health, carrot, size, eatable). Every step runs each phase of Plant.step, Rabbit.step and
+    Fox.step as one batched array operation over the whole species : plants grow and make
+    cuttings, then rabbits extract carrots, reproduce, feed, move and die, then foxes reproduce,
+    feed, move and die. Conflicts that the agents solve one after the other (two rabbits for one
+    carrot, two foxes for one rabbit) are solved by ranking the agents of a cell in random order.
+
+    It replaces both the scheduler (steps, time, step) and the species registry (count,
+    average_health) of the model, so the datacollector reporters work unchanged.
+    """
+    def __init__(self, model, grow_time:int = 5):
+        """Create the initial populations of the model
+
+        Args:
+            model (ForagingModel): model the engine runs, its map must already be generated
+            grow_time (int, optional): Time for a new plant to become edible (in nbr of steps). Defaults to 5.
+        """
+        self.model = model
+        self.steps = 0
+        self.time = 0
+        self.grow_time = grow_time
+        self.width = model.grid.width
+        self.height = model.grid.height
+        self.n_cells = self.width*self.height
+        #Flat altitude, indexed by cell = x*height + y
+        self.altitude = np.asarray(model.altitude).ravel()
+        #Neighbouring cells of each cell, without the center (moves) and with it (cuttings)
+        self.moore = model.grid.moore
+        self.moore_center = model.grid.moore_center
+        #Kind of the move to each neighbour
+        self.transitions = model.transitions
+        self.rng = model.rng
+
+        self.rabbits = self._new_animals(model.num_agents, model.r_max_health)
+        self.rabbits["carrot"] = np.full(model.num_agents, 5, dtype=np.int64)
+        self.foxes = self._new_animals(model.num_foxes, model.f_max_health)
+        self.plants = self._new_plants(self._random_cells(model.num_plants))
+        if model.timer is not None:
+            model.timer.instrument(self, ["plants_step", "rabbits_step", "foxes_step", "extract_carrot",
+                    "rabbits_feed", "foxes_feed", "sexual_reprod", "move"])
+
+    @property
+    def agents(self):
+        #No agent objects in this engine
+        return []
+
+    def get_agent_count(self):
+        return len(self.rabbits["cell"]) + len(self.plants["cell"]) + len(self.foxes["cell"])
+
+    def count(self, species):
+        """Number of living individuals of a species
+
+        Args:
+            species (class): agent class (Rabbit, Plant, Fox)
+
+        Returns:
+            int: population size
+        """
+        return len(self._columns(species)["cell"])
+
+    def average_health(self, species):
+        """Average health of a species, 0 if the species is extinct
+
+        Args:
+            species (class): agent class (Rabbit, Fox)
+
+        Returns:
+            float: average health
+        """
+        health = self._columns(species)["health"]
+        if len(health) == 0:
+            return 0
+        return health.mean()
+
+    def positions(self, species):
+        """(x, y) positions of all the individuals of a species
+
+        Args:
+            species (class): agent class (Rabbit, Plant, Fox)
+
+        Returns:
+            tuple: (x, y) arrays
+        """
+        return np.divmod(self._columns(species)["cell"], self.height)
+
+    def step(self):
+        """Advance every species by one step
+        """
+        self.plants_step()
+        self.rabbits_step()
+        self.foxes_step()
+        self.steps += 1
+        self.time += 1
+
+    def plants_step(self):
+        """Plant.grow then Plant.cuttings for every plant
+        """
+        plants = self.plants
+        #Growing, plants become eatable the step after reaching grow_time
+        ripening = ~plants["eatable"] & (plants["size"] == self.grow_time)
+        plants["eatable"] |= ripening
+        plants["size"] += plants["size"] < self.grow_time
+        #Activation time of the plants ripening this step, in the agents engine they are only found by the
+        #rabbits activated after them (plants eatable before stay at 0, found by every rabbit)
+        plants["ripe_at"] = np.zeros(len(plants["cell"]))
+        plants["ripe_at"][ripening] = self.rng.random(np.count_nonzero(ripening))
+
+        #Asexual reproduction : where the cuttings fall
+        n = len(plants["cell"])
+        falls = self.rng.random(n) < self.model.p_reprod_rate
+        neighbourhood = self.moore_center[plants["cell"][falls]]
+        dispersion = neighbourhood[np.arange(len(neighbourhood)), self.rng.integers(0, 9, len(neighbourhood))]
+        #Competition from other plants and terrain
+        neighbours = np.bincount(plants["cell"], minlength=self.n_cells)[dispersion]
+        competition_factor = 1 - 1/(neighbours + 1)
+        grows = (self.rng.random(len(dispersion)) > competition_factor) & (self.altitude[dispersion] > 0)
+        self.plants = self._concat(plants, self._new_plants(dispersion[grows]))
+
+    def rabbits_step(self):
+        """Rabbit.step for every rabbit : extract carrot, reproduce, feed, move and die
+        """
+        n = len(self.rabbits["cell"])
+        active = np.ones(n, dtype=bool)
+        newborns = []
+        #Activation time of each rabbit in the step, between 0 and 1
+        self._activation = self.rng.random(n)
+        self.extract_carrot(active)
+        newborns.append(self.sexual_reprod(self.rabbits, active, self.model.r_reprod_rate, self.model.r_max_health))
+        self.rabbits_feed(active)
+        downhill = self.move(self.rabbits, active)
+        #Bonus actions after a downhill move
+        self.extract_carrot(downhill)
+        newborns.append(self.sexual_reprod(self.rabbits, downhill, self.model.r_reprod_rate, self.model.r_max_health))
+        self.rabbits_feed(downhill)
+        #Dies if not eating enough, newborns only act from next step
+        self.rabbits = self._keep(self.rabbits, self.rabbits["health"] > 0)
+        for babies in newborns:
+            babies["carrot"] = np.full(len(babies["cell"]), 5, dtype=np.int64)
+            self.rabbits = self._concat(self.rabbits, babies)
+
+    def foxes_step(self):
+        """Fox.step for every fox : reproduce, eat a rabbit, move and die
+        """
+        n = len(self.foxes["cell"])
+        active = np.ones(n, dtype=bool)
+        newborns = []
+        newborns.append(self.sexual_reprod(self.foxes, active, self.model.f_reprod_rate, self.model.f_max_health))
+        self.foxes_feed(active)
+        downhill = self.move(self.foxes, active)
+        newborns.append(self.sexual_reprod(self.foxes, downhill, self.model.f_reprod_rate, self.model.f_max_health))
+        self.foxes_feed(downhill)
+        self.foxes = self._keep(self.foxes, self.foxes["health"] > 0)
+        for babies in newborns:
+            self.foxes = self._concat(self.foxes, babies)
+
+    def extract_carrot(self, active):
+        """Rabbits standing on a cell with eatable plants make one of them into a carrot.
+        The rabbits of a cell take the plants in activation order, each one only finds the plants
+        still there that ripened before its activation
+
+        Args:
+            active (np.ndarray): boolean mask of the rabbits taking this action
+        """
+        rabbits, plants = self.rabbits, self.plants
+        eatable = np.flatnonzero(plants["eatable"])
+        plant_cells = plants["cell"][eatable]
+        ripe_at = plants["ripe_at"][eatable]
+        hungry = np.flatnonzero(active)
+        hungry_cells = rabbits["cell"][hungry]
+        times = self._activation[hungry]
+        #Plants of its cell ripe before each rabbit, ripe_at is in [0, 1) so cell + ripe_at sorts by cell then time
+        keys = np.sort(plant_cells + ripe_at)
+        visible = np.searchsorted(keys, hungry_cells + times) - np.searchsorted(keys, hungry_cells)
+
+        #The k-th rabbit of a cell (from 0) finds a carrot if fewer than visible_k were taken before it, so
+        #the first k+1 rabbits take S_k = min(S_k-1 + 1, visible_k) = min(k + 1, min_j<=k(visible_j - j) + k)
+        order = np.lexsort((times, hungry_cells))
+        sorted_cells = hungry_cells[order]
+        rank = np.arange(len(order)) - np.searchsorted(sorted_cells, sorted_cells)
+        slack = visible[order] - rank
+        #Minimum per cell : later cells are shifted below the earlier ones so the running minimum restarts
+        group = np.cumsum(rank == 0) - 1
+        shift = group*(len(order) + (slack.max() if len(order) else 0) + 1)
+        taken = np.minimum(rank + 1, np.minimum.accumulate(slack - shift) + shift + rank)
+        found = np.zeros(len(hungry), dtype=bool)
+        found[order] = taken > np.where(rank > 0, np.roll(taken, 1), 0)
+        rabbits["carrot"][hungry[found]] += 1
+
+        #The plants taken in a cell are the first ripe ones, in random order among plants ripe at the same time
+        taken = np.bincount(hungry_cells[found], minlength=self.n_cells)
+        order = np.lexsort((self.rng.random(len(eatable)), ripe_at, plant_cells))
+        sorted_cells = plant_cells[order]
+        eaten = order[np.arange(len(order)) - np.searchsorted(sorted_cells, sorted_cells) < taken[sorted_cells]]
+        survivors = np.ones(len(plants["cell"]), dtype=bool)
+        survivors[eatable[eaten]] = False
+        self.plants = self._keep(plants, survivors)
+
+    def rabbits_feed(self, active):
+        """Rabbit.feed : eat a carrot, starve, or give a carrot to a cellmate when having plenty
+
+        Args:
+            active (np.ndarray): boolean mask of the rabbits taking this action
+        """
+        rabbits = self.rabbits
+        carrot, health = rabbits["carrot"], rabbits["health"]
+        starving = active & (carrot == 0)
+        eating = active & (carrot > 0) & (carrot < 5)
+        giving = np.flatnonzero(active & (carrot >= 5))
+        health[starving] -= 1
+        carrot[eating] -= 1
+        health[eating] = 5
+
+        #Give a carrot to a random rabbit of the same cell (possibly itself)
+        order = np.argsort(rabbits["cell"], kind="stable")
+        counts = np.bincount(rabbits["cell"], minlength=self.n_cells)
+        starts = np.cumsum(counts) - counts
+        giver_cells = rabbits["cell"][giving]
+        giving_mask = counts[giver_cells] > 1
+        giving, giver_cells = giving[giving_mask], giver_cells[giving_mask]
+        picked = (self.rng.random(len(giving))*counts[giver_cells]).astype(np.int64)
+        others = order[starts[giver_cells] + picked]
+        carrot[giving] -= 1
+        np.add.at(carrot, others, 1)
+
+    def foxes_feed(self, active):
+        """Fox.feed : each fox eats a rabbit of its cell if there's one left, or starves
+
+        Args:
+            active (np.ndarray): boolean mask of the foxes taking this action
+        """
+        foxes, rabbits = self.foxes, self.rabbits
+        preys = np.bincount(rabbits["cell"], minlength=self.n_cells)
+        hunters = np.flatnonzero(active)
+        hunter_cells = foxes["cell"][hunters]
+        eaten = self._random_rank(hunter_cells) < preys[hunter_cells]
+        foxes["health"][hunters[eaten]] = self.model.f_max_health
+        foxes["health"][hunters[~eaten]] -= 1
+
+        caught = np.bincount(hunter_cells[eaten], minlength=self.n_cells)
+        killed = self._random_rank(rabbits["cell"]) < caught[rabbits["cell"]]
+        self.rabbits = self._keep(rabbits, ~killed)
+
+    def sexual_reprod(self, animals, active, reprod_rate:float, max_health:int):
+        """Sexual reproduction as in Rabbit.sexual_reprod and Fox.sexual_reprod : an animal only
+        looks at the first animal of its cell and may make a baby if it's of the opposite sex
+
+        Args:
+            animals (dict): columns of the species
+            active (np.ndarray): boolean mask of the animals taking this action
+            reprod_rate (float): reproduction probability of the species
+            max_health (int): health of newborns
+
+        Returns:
+            dict: columns of the newborns
+        """
+        cells = animals["cell"]
+        #A random animal of each cell is the first of the cellmates list
+        first = np.flatnonzero(self._random_rank(cells) == 0)
+        first_sex = np.zeros(self.n_cells, dtype=bool)
+        first_sex[cells[first]] = animals["sex"][first]
+        candidates = np.flatnonzero(active)
+        partner = first_sex[cells[candidates]] != animals["sex"][candidates]
+        match = self.rng.random(len(candidates)) < reprod_rate
+        parents_cells = cells[candidates[partner & match]]
+        return {
+            "cell": parents_cells,
+            "sex": self.rng.random(len(parents_cells)) < 0.5,
+            "health": np.full(len(parents_cells), max_health, dtype=np.int64),
+            }
+
+    def move(self, animals, active):
+        """Moves to a random neighbouring cell. Water is never entered, and moving downhill
+        gives the animal bonus actions (returned mask)
+
+        Args:
+            animals (dict): columns of the species
+            active (np.ndarray): boolean mask of the animals moving
+
+        Returns:
+            np.ndarray: boolean mask of the animals which moved downhill
+        """
+        movers = np.flatnonzero(active)
+        current = animals["cell"][movers]
+        neighbour = self.rng.integers(0, 8, len(movers))
+        target = self.moore[current, neighbour]
+        transition = self.transitions[current, neighbour]
+        moves = transition != BLOCKED
+        animals["cell"][movers[moves]] = target[moves]
+        downhill = np.zeros(len(animals["cell"]), dtype=bool)
+        downhill[movers[transition == DOWNHILL]] = True
+        return downhill
+
+    def _columns(self, species):
+        if species is Rabbit:
+            return self.rabbits
+        elif species is Plant:
+            return self.plants
+        elif species is Fox:
+            return self.foxes
+        else :
+            raise ValueError("No such species in the vectorized engine : {}".format(species))
+
+    def _random_cells(self, n:int):
+        return self.rng.integers(0, self.width, n)*self.height + self.rng.integers(0, self.height, n)
+
+    def _new_animals(self, n:int, max_health:int):
+        return {
+            "cell": self._random_cells(n),
+            "sex": self.rng.random(n) < 0.5,
+            "health": np.full(n, max_health, dtype=np.int64),
+            }
+
+    def _new_plants(self, cells):
+        return {
+            "cell": cells,
+            "size": np.zeros(len(cells), dtype=np.int64),
+            "eatable": np.zeros(len(cells), dtype=bool),
+            "ripe_at": np.zeros(len(cells)),
+            }
+
+    def _random_rank(self, cells):
+        """Rank of each element among those of the same cell, in random order
+
+        Args:
+            cells (np.ndarray): cell of each element
+
+        Returns:
+            np.ndarray: 0 for the first element of each cell, 1 for the second,...
+        """
+        order = self.rng.permutation(len(cells))
+        order = order[np.argsort(cells[order], kind="stable")]
+        sorted_cells = cells[order]
+        starts = np.searchsorted(sorted_cells, sorted_cells, side="left")
+        rank = np.empty(len(cells), dtype=np.int64)
+        rank[order] = np.arange(len(cells)) - starts
+        return rank
+
+    @staticmethod
+    def _keep(columns, mask):
+        return {name: column[mask] for name, column in columns.items()}
+
+    @staticmethod
+    def _concat(columns, new):
+        return {name: np.concatenate([column, new[name]]) for name, column in columns.items()}
@@ -1,9 +1,37 @@
+import hashlib
+import inspect
+import json
+import os
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from scipy import sparse as sp
+from scipy.integrate import solve_ivp
+
+#store.py puts the foraging folder on the path, for its chunked store and write_atomic
+from store import TrajectoryStore
+from atomic import write_atomic
+
+EFFECT_TYPES = ("competition", "predation")
+#Outcomes of a sweep, index = code in the outcome cube
+OUTCOMES = ("coexistence", "exclusion of species 1", "exclusion of species 2", "extinction")
+#Interaction matrices with less than this fraction of non-zero interactions are sparse by default
+SPARSE_DENSITY = 0.1
+
 
 class simple_simulation:
+    """Lotka-Volterra competition between species : dNi = ri*Ni*(1 - sum_j Aij*Nj/Ki), with Aii = 1.
+
+    The species parameters and effects are compiled once into a growth vector r, a carrying capacity
+    vector K and an interaction matrix A, so a step updates all the species with one NumPy expression.
+    A competition effect of j on i adds its intensity to Aij. A predation effect of a predator j on a
+    prey i adds its intensity to Aij (the predator reduces the prey) and removes it from Aji (the prey
+    feeds the predator). Large communities get a sparse A (scipy.sparse CSR), a step then costs
+    O(species + interactions), and long runs can stream their trajectories to disk (see store.py).
+    stochastic_run simulates whole individuals with demographic noise, for extinction risks
+    """
     def __init__(self):
         pass
 
@@ -12,78 +40,362 @@ class simple_simulation:
                 species_effects:list = [{"type":"competition", "from_species":"species_1", "on_species":"species_2", "intensity":0.1},\
                     {"type":"competition", "from_species":"species_2", "on_species":"species_1", "intensity":0.1},\
                     {"type":"predation", "from_species":"species_1", "on_species":"species_2", "intensity":0.1}],\
-                steps:int = 20):
-        
-        #dict of species:pop
-        population_size = {species["name"]:[species["initial_pop"]] for species in species_parameters}
+                steps:int = 20, continuous:bool = False, graphics:bool = True, path:str = None):
+        """Simulate the populations and plot them
+
+        Args:
+            steps (int, optional): number of steps, or time span of the continuous simulation. Defaults to 20.
+            continuous (bool, optional): integrate the continuous-time equations with solve_ivp instead of
+                the discrete steps. Defaults to False.
+            graphics (bool, optional): plot the populations and the isoclines of the first two species. Defaults to True.
+            path (str, optional): .npz file the trajectories are streamed to, kept in memory if None. Defaults to None.
 
-        #Update population a t+1 iteratively
-        for step in range(0, steps):
-            self.iterative_run(population_size, species_effects, species_parameters, step)
-            
-        print(population_size)
+        Returns:
+            pd.DataFrame: population of each species (columns) at each step, or a TrajectoryReader of the
+                file if path is given
+        """
+        parameters = self.compile(species_parameters, species_effects)
+        if continuous:
+            populations = self.continuous_run(parameters, steps, path=path)
+        else :
+            populations = self.iterative_run(parameters, steps, path=path)
+        if path is None:
+            pop_data = pd.DataFrame(populations, columns=parameters["names"])
+            print(pop_data.iloc[-1].to_dict())
+        else :
+            pop_data = populations
+            print(dict(zip(pop_data.names, pop_data.final().tolist())))
 
         #Plot the data
-        pop_data = pd.DataFrame(population_size)
-        self.iterative_plot(pop_data) 
-        self.general_plot(species_parameters, species_effects)   
-
-    def iterative_run(self, population_size, species_effects, species_parameters, step):
-        #Compute population a t+1
-        #Use a try Except KeyError instead
-        #Updates populations one by one
-        for species, population in population_size.items():
-            #Get latest population
-            current_pop = population[-1]
-            #Do not update extinct species
-            if current_pop<=0:
-                population_size[species].append(0)
-                continue
-
-            #Apply competition effects and add to the list of population at each step
-            new_pop = self.apply_effects(species, current_pop, population_size, species_effects, species_parameters, step)
-            population_size[species].append(new_pop)
-
-            
-        return population_size
-    
-    def apply_effects(self,species,  current_pop, population_size, species_effects, species_parameters, step):
-        other_species = []
-        #Check how other species influence this one
-        relevant_competition = [effect for effect in species_effects if effect['on_species'] == species and effect["type"]=="competition"]
-        print(relevant_competition)
-        #Computer the effect of competition at time t for each competitor (aij*Nj/Ki)
-        carrying_capacity = [data["carrying_capacity"] for data in species_parameters if data["name"] == species][0] #Ki
-        reprod = [data["reproductive_rate"] for data in species_parameters if data["name"] == species][0] #r
-        competition_effects_list = []
-        for effect in relevant_competition:
-            species_competitor = effect["from_species"] #aij
-            population_competitor = population_size[species_competitor][-1] #Nj
-            competition_effects = effect["intensity"]*population_competitor/carrying_capacity
-            competition_effects_list.append(competition_effects)
-
-        total_effect = 1-current_pop/carrying_capacity
-        for competition_effect in competition_effects_list:
-            total_effect = total_effect-competition_effect
-            print(total_effect)
-
-        new_pop = current_pop + current_pop*reprod*total_effect
-
-        if new_pop < 0 :
-            new_pop = 0
-        return new_pop
+        if graphics:
+            self.iterative_plot(pop_data if path is None else pop_data.dataframe(every=max(1, steps//10000)))
+            if len(species_parameters) >= 2:
+                self.general_plot(species_parameters, species_effects)
+        return pop_data
+
+    def compile(self, species_parameters:list, species_effects:list, sparse:bool = None):
+        """Arrays of the species parameters and effects
+
+        Args:
+            sparse (bool, optional): build A as a scipy.sparse CSR matrix, None to use it when less than
+                SPARSE_DENSITY of the interactions are non-zero. Defaults to None.
+
+        Returns:
+            dict: species names, initial populations, r, K and the interaction matrix A
+
+        Raises:
+            ValueError: Error if an effect has an unknown type or species
+        """
+        names = [species["name"] for species in species_parameters]
+        index = {name:i for i, name in enumerate(names)}
+        initial = np.array([species["initial_pop"] for species in species_parameters], dtype=np.float64)
+        r = np.array([species["reproductive_rate"] for species in species_parameters], dtype=np.float64)
+        K = np.array([species["carrying_capacity"] for species in species_parameters], dtype=np.float64)
+        #Intraspecific competition is the logistic term Ni/Ki
+        targets, sources, intensities = list(range(len(names))), list(range(len(names))), [1.0]*len(names)
+        for effect in species_effects:
+            if effect["type"] not in EFFECT_TYPES:
+                raise ValueError("Unknown effect type {}, must be one of {}".format(effect["type"], EFFECT_TYPES))
+            for species in (effect["from_species"], effect["on_species"]):
+                if species not in index:
+                    raise ValueError("Effect on or from unknown species {}".format(species))
+            source, target = index[effect["from_species"]], index[effect["on_species"]]
+            targets.append(target)
+            sources.append(source)
+            intensities.append(effect["intensity"])
+            if effect["type"] == "predation":
+                targets.append(source)
+                sources.append(target)
+                intensities.append(-effect["intensity"])
+        #Several effects between the same species add up
+        A = sp.coo_matrix((intensities, (targets, sources)), shape=(len(names), len(names))).tocsr()
+        A.eliminate_zeros()
+        if sparse is None:
+            sparse = A.nnz < SPARSE_DENSITY*len(names)**2
+        if not sparse:
+            A = A.toarray()
+        return {"names":names, "initial":initial, "r":r, "K":K, "A":A}
+
+    def iterative_run(self, parameters:dict, steps:int, path:str = None, chunk_size:int = None):
+        """Discrete-time simulation, all the species are updated at once from the populations at t
+
+        Args:
+            parameters (dict): compiled parameters (see compile)
+            steps (int): number of steps
+            path (str, optional): .npz file the trajectories are streamed to, kept in memory if None. Defaults to None.
+            chunk_size (int, optional): steps kept in memory before writing them to path. Defaults to None, see TrajectoryStore.
+
+        Returns:
+            np.ndarray: (steps + 1, species) populations, initial populations first, or a TrajectoryReader
+                of the file if path is given
+        """
+        if path is not None:
+            store = TrajectoryStore(path, parameters["names"], chunk_size)
+            population = parameters["initial"].copy()
+            store.append(population)
+            for step in range(steps):
+                population = self.apply_effects(population, parameters["r"], parameters["K"], parameters["A"])
+                store.append(population)
+            return store.reader()
+        populations = np.empty((steps + 1, len(parameters["initial"])))
+        populations[0] = parameters["initial"]
+        for step in range(steps):
+            populations[step + 1] = self.apply_effects(populations[step], parameters["r"], parameters["K"], parameters["A"])
+        return populations
+
+    def apply_effects(self, population, r, K, A):
+        """Population at t+1 of every species
+
+        Args:
+            population (np.ndarray): populations at t
+
+        Returns:
+            np.ndarray: populations at t+1, extinct species stay at 0
+        """
+        #Competition effects sum_j Aij*Nj/Ki, Aii*Ni/Ki being the logistic term
+        new_pop = population + population*r*(1 - A @ population/K)
+        return np.maximum(new_pop, 0, out=new_pop)
+
+    def continuous_run(self, parameters:dict, steps:int, method:str = "RK45", path:str = None, chunk_size:int = None):
+        """Continuous-time simulation, integrated by solve_ivp with adaptive steps
+
+        Args:
+            parameters (dict): compiled parameters (see compile)
+            steps (int): time span, populations are reported at every whole time
+            method (str, optional): integration method of solve_ivp, "LSODA" for stiff systems. Defaults to "RK45".
+            path (str, optional): .npz file the trajectories are streamed to, kept in memory if None. The
+                integration is then done over successive spans of chunk_size. Defaults to None.
+            chunk_size (int, optional): time span integrated and kept in memory before writing it to path. Defaults to None, see TrajectoryStore.
+
+        Returns:
+            np.ndarray: (steps + 1, species) populations, initial populations first, or a TrajectoryReader
+                of the file if path is given
+
+        Raises:
+            ValueError: Error if the integration fails
+        """
+        r, K, A = parameters["r"], parameters["K"], parameters["A"]
+
+        def growth(t, population):
+            return population*r*(1 - A @ population/K)
 
+        def integrate(start, end, initial):
+            solution = solve_ivp(growth, (start, end), initial, method=method, t_eval=np.arange(start, end + 1))
+            if not solution.success:
+                raise ValueError("Integration failed : {}".format(solution.message))
+            return np.maximum(solution.y.T, 0)
+
+        if path is None:
+            return integrate(0, steps, parameters["initial"])
+        store = TrajectoryStore(path, parameters["names"], chunk_size)
+        population = parameters["initial"]
+        store.append(population)
+        for start in range(0, steps, store.chunk_size):
+            populations = integrate(start, min(start + store.chunk_size, steps), population)
+            for population in populations[1:]:
+                store.append(population)
+        return store.reader()
+
+    def stochastic_run(self, parameters:dict, steps:int, replicates:int = 1000, tau:float = 0.05, critical:int = 10,
+            seed:int = None):
+        """Stochastic simulation with whole individuals, for many replicates at once (one replicate axis).
+
+        Each species has two Poisson processes whose mean matches the continuous equations : births at rate
+        ri*Ni*(1 + sum_j max(-Aij, 0)*Nj/Ki) (growth and prey eaten) and deaths at rate
+        ri*Ni*sum_j max(Aij, 0)*Nj/Ki (crowding, competition and predation). Replicates advance by tau-leaping,
+        a Poisson number of births and deaths per leap of tau. Replicates where a species is below critical
+        individuals (but not extinct) switch to the exact Gillespie algorithm over the leap, so extinctions
+        are not an artifact of the leaps
+
+        Args:
+            parameters (dict): compiled parameters (see compile)
+            steps (int): time span, populations are reported at every whole time
+            replicates (int, optional): number of independent trajectories. Defaults to 1000.
+            tau (float, optional): length of a leap, rounded so a whole number of leaps makes one time unit. Defaults to 0.05.
+            critical (int, optional): populations below this are simulated exactly. Defaults to 10.
+            seed (int, optional): seed of the random generator. Defaults to None.
+
+        Returns:
+            np.ndarray: (steps + 1, replicates, species) populations, initial populations first
+        """
+        rng = np.random.default_rng(seed)
+        r, K, A = parameters["r"], parameters["K"], parameters["A"]
+        #Interactions killing (positive) and feeding (negative) a species
+        harm, benefit = (A.maximum(0), (-A).maximum(0)) if sp.issparse(A) else (np.maximum(A, 0), np.maximum(-A, 0))
+        species = len(r)
+
+        def propensities(population):
+            #(replicates, 2*species) rates, births then deaths
+            rate = r*population
+            births = rate*(1 + (benefit @ population.T).T/K)
+            deaths = rate*(harm @ population.T).T/K
+            return np.concatenate([births, deaths], axis=1)
+
+        leaps = max(1, int(round(1/tau)))
+        tau = 1/leaps
+        population = np.broadcast_to(np.rint(parameters["initial"]).astype(np.int64), (replicates, species)).copy()
+        populations = np.empty((steps + 1, replicates, species), dtype=np.int64)
+        populations[0] = population
+        for step in range(steps*leaps):
+            small = ((population > 0) & (population < critical)).any(axis=1)
+            leaping = np.flatnonzero(~small)
+            if leaping.size:
+                rates = propensities(population[leaping])*tau
+                change = rng.poisson(rates[:, :species]) - rng.poisson(rates[:, species:])
+                #A leap can overshoot an extinction
+                population[leaping] = np.maximum(population[leaping] + change, 0)
+            #Gillespie, one event per exact replicate and iteration, until each one reaches the end of the leap
+            exact = np.flatnonzero(small)
+            clock = np.zeros(exact.size)
+            while exact.size:
+                rates = propensities(population[exact])
+                total = rates.sum(axis=1)
+                with np.errstate(divide="ignore"):
+                    clock += rng.standard_exponential(exact.size)/total
+                fires = clock < tau
+                exact, clock, rates, total = exact[fires], clock[fires], rates[fires], total[fires]
+                events = (rates.cumsum(axis=1) < (rng.random(exact.size)*total)[:, None]).sum(axis=1)
+                events = np.minimum(events, 2*species - 1)
+                np.add.at(population, (exact, events % species), np.where(events < species, 1, -1))
+            if (step + 1) % leaps == 0:
+                populations[(step + 1)//leaps] = population
+        return populations
+
+    def extinction_probability(self, populations, names:list):
+        """Fraction of the replicates of stochastic_run where each species is extinct, through time
+
+        Args:
+            populations (np.ndarray): (times, replicates, species) populations of stochastic_run
+            names (list): names of the species
+
+        Returns:
+            pd.DataFrame: extinction probability of each species (columns) at each time
+        """
+        probability = pd.DataFrame((populations == 0).mean(axis=1), columns=names)
+        probability.index.name = "time"
+        return probability
+
+    def sweep(self, ranges:dict, species_parameters:list = None, species_effects:list = None, steps:int = 200,
+            threshold:float = 1, cache_dir:str = None):
+        """Simulate a whole grid of parameters of two species at once, and classify the outcome of each point.
+        All the grid points are advanced together as one batched array, no python loop over the grid
+
+        Args:
+            ranges (dict): values of each swept parameter, keys are ("r", species), ("K", species) or
+                (effect type, from_species, on_species), a swept effect replaces the intensity of the same
+                effect in species_effects
+            species_parameters (list, optional): parameters not swept, see run. Defaults to the ones of run.
+            species_effects (list, optional): effects not swept, see run. Defaults to the ones of run.
+            steps (int, optional): number of steps of each simulation. Defaults to 200.
+            threshold (float, optional): a species is excluded if its population stays below this over the
+                last tenth of the steps. Defaults to 1.
+            cache_dir (str, optional): folder where finished grids are saved and read back, no cache if None. Defaults to None.
+
+        Returns:
+            dict: species names, swept keys and values (axes of the cube, in order), outcome cube (codes of
+                OUTCOMES) and final populations (cube of shape (*axes, 2))
+
+        Raises:
+            ValueError: Error if there are not exactly two species, or a key is unknown
+        """
+        defaults = inspect.signature(self.run).parameters
+        if species_parameters is None:
+            species_parameters = defaults["species_parameters"].default
+        if species_effects is None:
+            species_effects = defaults["species_effects"].default
+        if len(species_parameters) != 2:
+            raise ValueError("Sweeps classify the outcome of two species, not {}".format(len(species_parameters)))
+        keys = [tuple(key) for key in ranges]
+        values = [np.asarray(ranges[key], dtype=np.float64) for key in ranges]
+
+        if cache_dir is not None:
+            description = json.dumps({"species_parameters": species_parameters, "species_effects": species_effects,
+                    "keys": keys, "values": [value.tolist() for value in values], "steps": steps, "threshold": threshold},
+                    sort_keys=True)
+            path = os.path.join(cache_dir, hashlib.sha1(description.encode()).hexdigest() + ".npz")
+            if os.path.exists(path):
+                with np.load(path) as cached:
+                    return {"names": [species["name"] for species in species_parameters], "keys": keys, "values": values,
+                            "outcome": cached["outcome"], "final": cached["final"]}
+
+        #Swept effects replace the fixed ones
+        swept = {key for key in keys if key[0] in EFFECT_TYPES}
+        fixed_effects = [effect for effect in species_effects
+                if (effect["type"], effect["from_species"], effect["on_species"]) not in swept]
+        parameters = self.compile(species_parameters, fixed_effects, sparse=False)
+        index = {name:i for i, name in enumerate(parameters["names"])}
+        shape = tuple(len(value) for value in values)
+        r = np.broadcast_to(parameters["r"], shape + (2,)).copy()
+        K = np.broadcast_to(parameters["K"], shape + (2,)).copy()
+        A = np.broadcast_to(parameters["A"], shape + (2, 2)).copy()
+        for axis, (key, value) in enumerate(zip(keys, values)):
+            if any(species not in index for species in key[1:]):
+                raise ValueError("Unknown species in sweep key {}".format(key))
+            #Values along their own axis of the grid
+            value = value.reshape([-1 if i == axis else 1 for i in range(len(shape))])
+            if key[0] == "r" and len(key) == 2:
+                r[..., index[key[1]]] = value
+            elif key[0] == "K" and len(key) == 2:
+                K[..., index[key[1]]] = value
+            elif key[0] in EFFECT_TYPES and len(key) == 3:
+                source, target = index[key[1]], index[key[2]]
+                A[..., target, source] += value
+                if key[0] == "predation":
+                    A[..., source, target] -= value
+            else :
+                raise ValueError("Unknown sweep key {}, must be ('r', species), ('K', species) or (effect type, from, on)".format(key))
+
+        population = np.broadcast_to(parameters["initial"], shape + (2,)).copy()
+        window = max(1, steps//10)
+        highest = np.zeros(shape + (2,))
+        with np.errstate(over="ignore", invalid="ignore"):
+            for step in range(steps):
+                population += population*r*(1 - np.einsum("...ij,...j->...i", A, population)/K)
+                #Diverging points (nan) are counted as extinct, like negative populations
+                np.fmax(population, 0, out=population)
+                if step >= steps - window:
+                    np.maximum(highest, population, out=highest)
+        survives = highest >= threshold
+        outcome = np.select([survives[..., 0] & survives[..., 1], survives[..., 1], survives[..., 0]], [0, 1, 2], 3).astype(np.int8)
+        final = population.astype(np.float32)
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            write_atomic(path, lambda temporary: np.savez(temporary, outcome=outcome, final=final))
+        return {"names": parameters["names"], "keys": keys, "values": values, "outcome": outcome, "final": final}
+
+    def sweep_plot(self, result:dict):
+        """Phase diagram of a sweep over two parameters : outcome of each point of the grid
+
+        Args:
+            result (dict): result of sweep, with two swept parameters
+        """
+        (x_key, y_key), (x_values, y_values) = result["keys"], result["values"]
+        #Outcome codes as a categorical colormap, first axis along x
+        plt.pcolormesh(x_values, y_values, result["outcome"].T, cmap=plt.get_cmap("tab10", 10), vmin=-0.5, vmax=9.5, shading="nearest")
+        names = [outcome.replace("species 1", result["names"][0]).replace("species 2", result["names"][1]) for outcome in OUTCOMES]
+        handles = [plt.Rectangle((0, 0), 1, 1, color=plt.get_cmap("tab10")(code)) for code in range(len(OUTCOMES))]
+        plt.legend(handles, names)
+        plt.xlabel(" ".join(x_key))
+        plt.ylabel(" ".join(y_key))
+        plt.show()
 
     def iterative_plot(self, pop_data):
         sns.lineplot(data=pop_data)
         plt.show()
 
-    def general_plot(self, species_parameters, species_effects):
+    def general_plot(self, species_parameters, species_effects, pair:tuple = None):
         """
         x-axis represents sepcies 2, y-axis represents species 1
+
+        Args:
+            pair (tuple, optional): names of the two species to plot, in a larger community. Defaults to the first two species.
         """
-        data_species_1 = species_parameters[0]
-        data_species_2 = species_parameters[1]
+        if pair is None:
+            data_species_1, data_species_2 = species_parameters[:2]
+        else :
+            data = {species["name"]:species for species in species_parameters}
+            data_species_1, data_species_2 = data[pair[0]], data[pair[1]]
 
         #effect of two on one
         try : 
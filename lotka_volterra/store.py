@@ -0,0 +1,112 @@
+import os
+import sys
+import zipfile
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+#The chunked .npz store is the one of the foraging data collector
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "foraging"))
+from collector import ChunkedStore, ChunkedReader
+
+#Default number of populations (steps x species) buffered before a chunk is written, 8 MB of float64
+CHUNK_VALUES = 2**20
+
+
+class TrajectoryReader(ChunkedReader):
+    """Lazy reader of the file of a TrajectoryStore, chunks are only loaded when read
+    """
+    def __init__(self, path:str):
+        super().__init__(path)
+        self.names = self.constants["names"].tolist()
+        self.index = {name:i for i, name in enumerate(self.names)}
+
+    def populations(self, species:list = None, every:int = 1):
+        """Load the trajectories, optionally keeping one step every few steps
+
+        Args:
+            species (list, optional): species to load. Defaults to all.
+            every (int, optional): keep one step every `every` steps. Defaults to 1.
+
+        Returns:
+            np.ndarray: (steps, species) populations
+        """
+        columns = list(range(len(self.names))) if species is None else [self.index[name] for name in species]
+        return self.read("populations", every, columns)
+
+    def final(self):
+        """Populations at the last step
+
+        Returns:
+            np.ndarray: population of each species
+        """
+        return self.last("populations")
+
+    def dataframe(self, species:list = None, every:int = 1):
+        """Load trajectories in a dataframe indexed by step
+
+        Args:
+            species (list, optional): species to load. Defaults to all.
+            every (int, optional): keep one step every `every` steps. Defaults to 1.
+
+        Returns:
+            pd.DataFrame: one column per species
+        """
+        species = species or self.names
+        data = self.populations(species, every)
+        frame = pd.DataFrame(data, columns=species, index=np.arange(len(data))*every)
+        frame.index.name = "step"
+        return frame
+
+    def plot(self, species:list = None, max_points:int = 10000, ax = None):
+        """Plot trajectories, reading the file chunk by chunk and keeping at most about max_points per species
+
+        Args:
+            species (list, optional): species to plot. Defaults to all.
+            max_points (int, optional): maximum number of points per line. Defaults to 10000.
+            ax (matplotlib axes, optional): where to plot. Defaults to the current axes.
+
+        Returns:
+            matplotlib axes: the plot
+        """
+        ax = ax or plt.gca()
+        self.dataframe(species, self.plot_every("populations", max_points)).plot(ax=ax)
+        return ax
+
+
+class TrajectoryStore(ChunkedStore):
+    """Streaming store of the populations of a simulation : each step is a row of one value per species,
+    in the chunked .npz format of the foraging data collector. The populations are one array of rows
+    "populations", the species names the constant "names", so long runs of large communities are read
+    back one chunk at a time with TrajectoryReader
+    """
+    reader_class = TrajectoryReader
+
+    def __init__(self, path:str, names:list, chunk_size:int = None, compression:int = zipfile.ZIP_STORED):
+        """Initialize the store, an existing file at path is overwritten
+
+        Args:
+            path (str): .npz file the chunks are written to
+            names (list): names of the species, one column each
+            chunk_size (int, optional): number of rows kept in memory before flushing. Defaults to None,
+                about CHUNK_VALUES values per chunk.
+            compression (int, optional): zipfile compression of the chunks, populations barely compress and
+                zipfile.ZIP_DEFLATED costs more than the simulation itself. Defaults to zipfile.ZIP_STORED.
+
+        Raises:
+            ValueError: Error if chunk_size is not positive
+        """
+        self.names = list(names)
+        if chunk_size is None:
+            chunk_size = max(1, CHUNK_VALUES//max(1, len(self.names)))
+        super().__init__(path, {"populations": (np.float64, (len(self.names),))}, chunk_size, compression=compression,
+                constants={"names": np.array(self.names)})
+
+    def append(self, population):
+        """Record the populations of a step
+
+        Args:
+            population (np.ndarray): population of each species
+        """
+        super().append((population,))
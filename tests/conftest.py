@@ -0,0 +1,7 @@
+import os
+import sys
+
+#The simulations are flat folders of modules imported by name, as when running their scripts
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ["foraging", "lotka_volterra"]:
+    sys.path.insert(0, os.path.join(ROOT, folder))
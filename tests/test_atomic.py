@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+import pytest
+
+from atomic import write_atomic
+
+
+def test_file_replaced(tmp_path):
+    path = str(tmp_path / "grid.npz")
+    for value in (1, 2):
+        assert write_atomic(path, lambda temporary: np.savez(temporary, value = value))
+    with np.load(path) as data:
+        assert data["value"] == 2
+    assert os.listdir(tmp_path) == ["grid.npz"]
+
+
+def test_first_folder_kept(tmp_path):
+    path = str(tmp_path / "terrain")
+    assert write_atomic(path, lambda temporary: np.save(os.path.join(temporary, "a.npy"), [1]), directory = True)
+    #Another process writing the same folder afterwards leaves the first one
+    assert not write_atomic(path, lambda temporary: np.save(os.path.join(temporary, "a.npy"), [2]), directory = True)
+    assert np.load(os.path.join(path, "a.npy"))[0] == 1
+    assert os.listdir(tmp_path) == ["terrain"]
+
+
+def test_failed_write_leaves_nothing(tmp_path):
+    def write(temporary):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        write_atomic(str(tmp_path / "grid.npz"), write)
+    with pytest.raises(OSError):
+        write_atomic(str(tmp_path / "terrain"), write, directory = True)
+    assert os.listdir(tmp_path) == []
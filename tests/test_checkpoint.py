@@ -0,0 +1,89 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from model import ForagingModel
+from collector import StreamingDataCollector
+
+
+def resume(tmp_path, steps = 60, crash = 45, interval = 30, streaming = False, **kwargs):
+    """Run a model without interruption, and the same model stopped after crash steps and resumed
+    from its last snapshot
+
+    Returns:
+        tuple: (uninterrupted model, resumed model)
+    """
+    kwargs = dict(seed = 4, silent = True, **kwargs)
+    collector = lambda name: str(tmp_path / name) if streaming else None
+    full = ForagingModel(20, 200, 6, 20, 20, collector_path = collector("full.npz"), **kwargs)
+    for i in range(steps):
+        full.step()
+    checkpoint = str(tmp_path / "checkpoint.npz")
+    crashed = ForagingModel(20, 200, 6, 20, 20, collector_path = collector("resumed.npz"),
+            checkpoint_path = checkpoint, checkpoint_interval = interval, **kwargs)
+    for i in range(crash):
+        crashed.step()
+    resumed = ForagingModel.load(checkpoint, silent = True)
+    assert resumed.schedule.steps == interval
+    for i in range(steps - interval):
+        resumed.step()
+    return full, resumed
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("engine, options", [
+    ("agents", {}),
+    ("agents", {"plant_layer": True}),
+    ("agents", {"stages": ["foxes", "plants", "rabbits"]}),
+    ("vectorized", {}),
+    ])
+def test_resumed_run_is_identical(tmp_path, engine, options, streaming):
+    full, resumed = resume(tmp_path, streaming = streaming, engine = engine, **options)
+    expected = full.datacollector.get_model_vars_dataframe().reset_index(drop = True)
+    data = resumed.datacollector.get_model_vars_dataframe().reset_index(drop = True)
+    assert len(data) == 60
+    assert data.equals(expected)
+    assert resumed.current_id == full.current_id
+
+
+def test_resumed_stop_conditions(tmp_path):
+    #Stops at step 70, the window of the last 50 steps is half filled at the snapshot
+    full, resumed = resume(tmp_path, steps = 90, crash = 50, interval = 40, engine = "agents",
+            stop_conditions = {"steady_window": 50, "steady_z": 1, "species": ["plants"]})
+    assert full.stop_step > 40
+    assert (resumed.running, resumed.stop_reason, resumed.stop_step) == (full.running, full.stop_reason, full.stop_step)
+    expected = full.datacollector.get_model_vars_dataframe().reset_index(drop = True)
+    assert resumed.datacollector.get_model_vars_dataframe().reset_index(drop = True).equals(expected)
+
+
+def test_collector_truncated_to_checkpoint(tmp_path):
+    path = str(tmp_path / "data.npz")
+    collector = StreamingDataCollector({"Step": lambda model: model.schedule.steps}, path, chunk_size = 5)
+    model = SimpleNamespace(schedule = SimpleNamespace(steps = 0))
+    for step in range(23):
+        model.schedule.steps = step
+        collector.collect(model)
+    collector.flush()
+    #A run resumed after the second chunk drops the chunks written after it
+    resumed = StreamingDataCollector({"Step": lambda model: model.schedule.steps}, path, chunk_size = 5, keep_chunks = 2)
+    assert np.array_equal(resumed.reader().column("Step"), np.arange(10))
+    for step in range(10, 13):
+        model.schedule.steps = step
+        resumed.collect(model)
+    assert np.array_equal(resumed.get_model_vars_dataframe().Step, np.arange(13))
+    assert os.listdir(tmp_path) == ["data.npz"]
+
+
+def test_load_keeps_the_saved_map(tmp_path, monkeypatch):
+    model = ForagingModel(5, 20, 2, 10, 10, seed = 2, silent = True)
+    path = str(tmp_path / "checkpoint.npz")
+    model.save(path)
+
+    def generate_map(*args, **kwargs):
+        raise AssertionError("The terrain is generated again")
+    monkeypatch.setattr(ForagingModel, "generate_map", generate_map)
+    resumed = ForagingModel.load(path, silent = True)
+    assert (resumed.altitude == model.altitude).all()
+    assert (resumed.transitions == model.transitions).all()
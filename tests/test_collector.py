@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from collector import StreamingDataCollector, CollectorReader
+
+
+def collect_steps(collector, steps):
+    model = SimpleNamespace(schedule = SimpleNamespace(steps = 0))
+    for step in range(steps):
+        model.schedule.steps = step
+        collector.collect(model)
+    return model
+
+
+def test_chunks_and_interval(tmp_path):
+    path = str(tmp_path / "data.npz")
+    collector = StreamingDataCollector({"Square": lambda model: model.schedule.steps**2}, path,
+            interval = 3, chunk_size = 4)
+    collect_steps(collector, 50)
+    #Steps 0, 3, ..., 48 : 17 rows, 4 full chunks flushed and one row still buffered
+    assert collector.chunks == 4 and collector.rows == 1
+    data = collector.get_model_vars_dataframe()
+    steps = np.arange(0, 50, 3)
+    assert np.array_equal(data.index, steps)
+    assert np.array_equal(data.Square, steps**2)
+
+
+def test_reader_every_across_chunks(tmp_path):
+    path = str(tmp_path / "data.npz")
+    collector = StreamingDataCollector({"Step": lambda model: model.schedule.steps}, path, chunk_size = 7)
+    collect_steps(collector, 40)
+    reader = collector.reader()
+    assert isinstance(reader, CollectorReader)
+    assert reader.columns == ["Step"]
+    assert np.array_equal(reader.column("Step", every = 3), np.arange(0, 40, 3))
+    assert np.array_equal(reader.dataframe(every = 5).index, np.arange(0, 40, 5))
+
+
+def test_existing_file_is_overwritten(tmp_path):
+    path = str(tmp_path / "data.npz")
+    collect_steps(StreamingDataCollector({"Step": lambda model: model.schedule.steps}, path, chunk_size = 2), 10)
+    collector = StreamingDataCollector({"Step": lambda model: model.schedule.steps}, path, chunk_size = 2)
+    collect_steps(collector, 3)
+    assert np.array_equal(collector.get_model_vars_dataframe().Step, [0, 1, 2])
+
+
+@pytest.mark.parametrize("interval, chunk_size", [(0, 10), (1, 0)])
+def test_invalid_settings(tmp_path, interval, chunk_size):
+    with pytest.raises(ValueError):
+        StreamingDataCollector({}, str(tmp_path / "data.npz"), interval = interval, chunk_size = chunk_size)
@@ -0,0 +1,17 @@
+import matplotlib
+matplotlib.use("Agg")
+
+from run import compare_engines
+
+#Bonferroni corrected false alarm rate of the whole comparison
+ALPHA = 0.01
+
+
+def test_vectorized_engine_matches_agents():
+    #Dense enough for rabbits to compete for the plants ripening during a step
+    summary, pvalues = compare_engines(False, steps = 12, R = 30, P = 200, F = 8, width = 20, height = 20,
+            runs = 100, seed = 0)
+    tests = pvalues.notna().to_numpy().sum()
+    assert tests > 0
+    worst = pvalues.min().min()
+    assert worst > ALPHA/tests, "Engines diverge :\n{}".format(pvalues)
@@ -0,0 +1,61 @@
+import logging
+
+import pytest
+
+from agent_logging import ModelLogger, setup_logging
+from agents import Rabbit
+from model import ForagingModel
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def shared():
+    logger = logging.getLogger("test_model_logger")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = ListHandler()
+    logger.addHandler(handler)
+    yield logger, handler
+    logger.removeHandler(handler)
+
+
+def test_model_loggers_are_independent(shared):
+    logger, handler = shared
+    loud = ModelLogger(logger)
+    silent = ModelLogger(logger, silent = True)
+    warnings = ModelLogger(logger, level = logging.WARNING)
+    for model_logger in (loud, silent, warnings):
+        model_logger.info("info %s", id(model_logger))
+        model_logger.warning("warning %s", id(model_logger))
+    assert handler.messages == ["info {}".format(id(loud)), "warning {}".format(id(loud)), "warning {}".format(id(warnings))]
+
+
+def test_sampling(shared):
+    logger, handler = shared
+    sampled = ModelLogger(logger, rate = 0.25)
+    for i in range(8):
+        sampled.info("%s", i)
+    assert len(handler.messages) == 2
+
+
+def test_settings_of_a_model_do_not_change_the_others():
+    first = ForagingModel(2, 5, 1, 5, 5, seed = 0, log_levels = {"rabbits": logging.DEBUG}, silent = True)
+    second = ForagingModel(2, 5, 1, 5, 5, seed = 0, log_levels = {"rabbits": logging.WARNING})
+    third = ForagingModel(2, 5, 1, 5, 5, seed = 0, silent = True)
+    assert first.loggers["rabbits"].disabled and third.loggers["rabbits"].disabled
+    assert not second.loggers["rabbits"].disabled
+    assert (first.loggers["rabbits"].level, second.loggers["rabbits"].level) == (logging.DEBUG, logging.WARNING)
+    #Agents log through the loggers of their own model
+    assert all(agent.logger is second.loggers["rabbits"] for agent in second.schedule.agents if isinstance(agent, Rabbit))
+
+def test_unknown_species():
+    with pytest.raises(ValueError):
+        setup_logging(levels = {"wolves": logging.INFO}, silent = True)
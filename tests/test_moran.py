@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+axl = pytest.importorskip("axelrod")
+from moran_process import MoranEnsemble, wilson_interval, _moran_run
+
+
+def test_wilson_interval():
+    low, high = wilson_interval([0, 5, 10], 10)
+    assert low[0] == 0 and high[2] == 1
+    assert (low[1:] < [0.5, 1]).all() and (high[:2] > [0, 0.5]).all()
+    #Symmetric around one half
+    assert np.isclose(low[1], 1 - high[1])
+    assert np.array_equal(np.column_stack(wilson_interval([3], 0)), [[0, 1]])
+
+
+def test_runs_only_depend_on_the_seed():
+    #Worker processes import axelrod again, which is slow, so one pool run is compared with the same runs in this process
+    players = [axl.Cooperator(), axl.Defector(), axl.TitForTat()]
+    ensemble = MoranEnsemble(players, ci_width = 0.5, min_runs = 6, max_runs = 6, seed = 3, processes = 2,
+            display_progress = False, turns = 2)
+    summary = ensemble.run_all()
+    runs = ensemble.get_runs_dataframe()
+    assert list(runs.run) == list(range(6))
+    expected = [_moran_run(players, seed, {"turns": 2}, ensemble.max_generations) for seed in runs.seed]
+    assert list(zip(runs.winner, runs.generations)) == expected
+    assert summary.fixations.sum() == 6
+    assert np.isclose(summary.probability.sum(), 1)
+
+
+@pytest.mark.parametrize("settings", [{"ci_width": 0}, {"ci_width": 1}, {"min_runs": 20, "max_runs": 10}])
+def test_invalid_settings(settings):
+    with pytest.raises(ValueError):
+        MoranEnsemble([axl.Cooperator(), axl.Defector()], **settings)
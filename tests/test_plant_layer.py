@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from model import ForagingModel
+
+#Bonferroni corrected false alarm rate of each comparison
+ALPHA = 0.01
+POPULATIONS = ["Rabbits", "Plants"]
+
+
+def trajectories(plant_layer, stages, runs, steps):
+    """Rabbits and plants of seeded runs, as a (runs, steps, populations) array
+    """
+    result = []
+    for seed in np.random.SeedSequence(1).generate_state(runs):
+        model = ForagingModel(20, 150, 4, 15, 15, plant_layer = plant_layer, stages = stages, seed = int(seed), silent = True)
+        for i in range(steps):
+            model.step()
+        result.append(model.datacollector.get_model_vars_dataframe()[POPULATIONS].to_numpy())
+    return np.array(result)
+
+
+@pytest.mark.parametrize("stages", [None, ["rabbits", "plants", "foxes"]])
+def test_plant_layer_matches_plant_agents(stages):
+    #Plants ripen from step 5, rabbits compete for them in the following steps
+    agents = trajectories(False, stages, runs = 150, steps = 12)
+    layer = trajectories(True, stages, runs = 150, steps = 12)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        pvalues = stats.ttest_ind(agents, layer, equal_var = False, axis = 0).pvalue
+    tests = np.count_nonzero(~np.isnan(pvalues))
+    assert tests > 0
+    assert np.nanmin(pvalues) > ALPHA/tests, "Plant layer diverges :\n{}".format(pvalues)
+
+
+def test_consume_only_finds_plants_ripe_before_the_rabbit():
+    model = ForagingModel(0, 0, 0, 5, 5, plant_layer = True, seed = 0, silent = True)
+    layer = model.plant_layer
+    cell = 2*5 + 3
+    #One plant eatable from the previous steps, two ripening this step
+    layer.sizes[cell, -1] = 3
+    layer.ripening = {cell: [0.2, 0.6]}
+    layer.activations = {1: 0.1, 2: 0.7}
+    assert layer.consume((2, 3), 1)
+    assert not layer.consume((2, 3), 1)
+    assert layer.consume((2, 3), 2) and layer.consume((2, 3), 2)
+    assert layer.eatable[cell] == 0
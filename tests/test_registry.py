@@ -0,0 +1,48 @@
+import pytest
+
+from registry import SpeciesRegistry
+
+
+class Rabbit:
+    def __init__(self, health):
+        self.health = health
+
+
+class Plant:
+    pass
+
+
+def test_counts_and_health():
+    registry = SpeciesRegistry()
+    rabbits = [Rabbit(2), Rabbit(4), Rabbit(6)]
+    plants = [Plant(), Plant()]
+    for agent in rabbits + plants:
+        registry.add(agent)
+    assert (registry.count(Rabbit), registry.count(Plant)) == (3, 2)
+    assert registry.average_health(Rabbit) == 4
+    registry.remove(rabbits[0])
+    registry.update_health(rabbits[1], -3)
+    rabbits[1].health = 1
+    assert registry.count(Rabbit) == 2
+    assert registry.average_health(Rabbit) == 3.5
+    registry.check(rabbits[1:] + plants)
+
+
+def test_extinct_species():
+    registry = SpeciesRegistry()
+    rabbit = Rabbit(3)
+    registry.add(rabbit)
+    registry.remove(rabbit)
+    assert (registry.count(Rabbit), registry.average_health(Rabbit)) == (0, 0)
+
+
+def test_check_finds_a_stale_counter():
+    registry = SpeciesRegistry()
+    rabbit = Rabbit(3)
+    registry.add(rabbit)
+    #Health changed without update_health
+    rabbit.health = 2
+    with pytest.raises(ValueError):
+        registry.check([rabbit])
+    with pytest.raises(ValueError):
+        registry.check([rabbit, Rabbit(2)])
@@ -0,0 +1,22 @@
+import pytest
+
+from model import ForagingModel
+
+
+def trajectory(seed, **kwargs):
+    model = ForagingModel(20, 150, 5, 15, 15, seed = seed, silent = True, **kwargs)
+    for i in range(40):
+        model.step()
+    return model.datacollector.get_model_vars_dataframe()
+
+
+@pytest.mark.parametrize("options", [
+    {"engine": "agents"},
+    {"engine": "agents", "plant_layer": True},
+    {"engine": "agents", "stages": ["rabbits", "plants", "foxes"]},
+    {"engine": "vectorized"},
+    ])
+def test_same_seed_same_trajectory(options):
+    first = trajectory(7, **options)
+    assert first.equals(trajectory(7, **options))
+    assert not first.equals(trajectory(8, **options))
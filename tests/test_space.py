@@ -0,0 +1,58 @@
+import pytest
+
+from model import ForagingModel
+from space import IndexedMultiGrid
+
+
+class Prey:
+    def __init__(self, sex = None, eatable = False):
+        self.pos = None
+        self.sex = sex
+        self.eatable = eatable
+
+
+class Predator(Prey):
+    pass
+
+
+def test_index_follows_the_agents():
+    grid = IndexedMultiGrid(5, 5, True)
+    female, male, ripe = Prey(sex = True), Prey(sex = False), Prey(eatable = True)
+    predator = Predator(sex = True)
+    for agent in (female, male, ripe, predator):
+        grid.place_agent(agent, (1, 2))
+    assert grid.get_species((1, 2), Prey) == [female, male, ripe]
+    assert grid.get_species((1, 2), Predator) == [predator]
+    assert (grid.count_sex((1, 2), Prey, True), grid.count_sex((1, 2), Prey, False)) == (1, 1)
+    assert grid.get_eatable((1, 2), Prey) == [ripe]
+
+    grid.move_agent(male, (3, 3))
+    grid.set_eatable(female, True)
+    female.eatable = True
+    grid.remove_agent(ripe)
+    assert grid.get_species((1, 2), Prey) == [female]
+    assert grid.get_species((3, 3), Prey) == [male]
+    assert (grid.count_sex((1, 2), Prey, False), grid.count_sex((3, 3), Prey, False)) == (0, 1)
+    assert (grid.count_eatable((1, 2), Prey), grid.get_eatable((1, 2), Prey)) == (1, [female])
+    assert grid.count_species((4, 4), Prey) == 0
+    grid.check()
+
+
+def test_check_finds_a_stale_index():
+    grid = IndexedMultiGrid(5, 5, True)
+    agent = Prey()
+    grid.place_agent(agent, (0, 0))
+    #Becomes eatable without telling the grid
+    agent.eatable = True
+    with pytest.raises(ValueError):
+        grid.check()
+
+
+@pytest.mark.parametrize("options", [{}, {"plant_layer": True}, {"stages": ["plants", "rabbits", "foxes"]}])
+def test_index_stays_in_sync_during_a_run(options):
+    #Debug models check the grid index and the species registry every step
+    model = ForagingModel(20, 150, 5, 15, 15, seed = 3, debug = True, silent = True, **options)
+    for i in range(30):
+        model.step()
+    model.grid.check()
+    model.registry.check(model.schedule.agents)
@@ -0,0 +1,48 @@
+import numpy as np
+from scipy import stats
+
+from lk_refacto import simple_simulation
+
+#Populations start above the critical size of the fallback (10) and the prey often dies out
+SPECIES = [{"name":"prey", "initial_pop":14, "carrying_capacity":14, "reproductive_rate":1},
+        {"name":"predator", "initial_pop":12, "carrying_capacity":10, "reproductive_rate":0.5}]
+EFFECTS = [{"type":"predation", "from_species":"predator", "on_species":"prey", "intensity":0.8}]
+REPLICATES = 4000
+
+
+def final_populations(critical, seed):
+    sim = simple_simulation()
+    populations = sim.stochastic_run(sim.compile(SPECIES, EFFECTS), 15, replicates = REPLICATES, critical = critical,
+            seed = seed)
+    return populations[-1]
+
+
+def test_fallback_matches_exact_gillespie():
+    #Leaps with the exact fallback under 10 individuals, against the exact algorithm for every population
+    leap = final_populations(critical = 10, seed = 1)
+    exact = final_populations(critical = 10**9, seed = 2)
+    #Two proportion z test on the extinction of the prey, 0.1% false alarm rate
+    leap_extinct, exact_extinct = (leap[:, 0] == 0).mean(), (exact[:, 0] == 0).mean()
+    assert 0.05 < exact_extinct < 0.95
+    pooled = (leap_extinct + exact_extinct)/2
+    z = abs(leap_extinct - exact_extinct)/np.sqrt(2*pooled*(1 - pooled)/REPLICATES)
+    assert z < 3.29, (leap_extinct, exact_extinct)
+    #Welch t test on the final populations of both species
+    assert (stats.ttest_ind(leap, exact, equal_var = False, axis = 0).pvalue > 0.001).all()
+
+
+def test_seeded_runs_are_reproducible():
+    sim = simple_simulation()
+    parameters = sim.compile(SPECIES, EFFECTS)
+    first = sim.stochastic_run(parameters, 5, replicates = 50, seed = 3)
+    assert first.shape == (6, 50, 2)
+    assert np.array_equal(first[0], np.broadcast_to([14, 12], (50, 2)))
+    assert np.array_equal(first, sim.stochastic_run(parameters, 5, replicates = 50, seed = 3))
+    assert (first >= 0).all()
+
+
+def test_extinction_probability():
+    populations = np.array([[[1, 0], [2, 3]], [[0, 0], [0, 1]]])
+    probability = simple_simulation().extinction_probability(populations, ["prey", "predator"])
+    assert list(probability.columns) == ["prey", "predator"]
+    assert np.array_equal(probability.to_numpy(), [[0, 0.5], [1, 0.5]])
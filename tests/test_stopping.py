@@ -0,0 +1,53 @@
+import pytest
+
+from stopping import StopConditions
+
+
+def populations(plants, rabbits, foxes):
+    return {"plants": plants, "rabbits": rabbits, "foxes": foxes}
+
+
+def test_extinction():
+    any_species = StopConditions(extinction = "any")
+    all_species = StopConditions(extinction = "all")
+    assert any_species.check(populations(10, 0, 3)) == "extinction"
+    assert all_species.check(populations(10, 0, 3)) is None
+    assert all_species.check(populations(0, 0, 0)) == "extinction"
+
+
+def test_extinction_of_the_watched_species_only():
+    conditions = StopConditions(species = ["rabbits"], extinction = "any")
+    assert conditions.check(populations(10, 5, 0)) is None
+    assert conditions.check(populations(10, 0, 0)) == "extinction"
+
+
+def test_max_population():
+    conditions = StopConditions(max_population = 100)
+    assert conditions.check(populations(100, 5, 3)) is None
+    assert conditions.check(populations(101, 5, 3)) == "max_population"
+
+
+def test_steady_state():
+    conditions = StopConditions(steady_window = 40)
+    #A growing population is not steady, its fluctuations around a level are
+    for step in range(100):
+        assert conditions.check(populations(100 + 5*step, 50 + step % 3, 20)) is None
+    reasons = [conditions.check(populations(600 + 30*(-1)**step, 50 + step % 3, 20)) for step in range(40)]
+    assert reasons[-1] == "steady_state"
+
+
+def test_steady_state_needs_a_full_window():
+    conditions = StopConditions(steady_window = 10)
+    reasons = [conditions.check(populations(100, 50, 20)) for step in range(10)]
+    assert reasons == [None]*9 + ["steady_state"]
+
+
+def test_params_rebuild_the_conditions():
+    conditions = StopConditions(species = ["plants"], extinction = "all", steady_window = 10)
+    assert StopConditions(**conditions.params).params == conditions.params
+
+
+@pytest.mark.parametrize("settings", [{"extinction": "some"}, {"steady_window": 3}])
+def test_invalid_settings(settings):
+    with pytest.raises(ValueError):
+        StopConditions(**settings)
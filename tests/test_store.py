@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scipy import sparse as sp
+
+from lk_refacto import simple_simulation
+from store import TrajectoryStore, TrajectoryReader
+
+
+def community(species = 60, effects = 150, seed = 0):
+    """Random community of competitors with a few predators, sparse enough for a CSR matrix
+    """
+    rng = np.random.default_rng(seed)
+    species_parameters = [{"name":"species_{}".format(i), "initial_pop":float(rng.uniform(5, 50)),
+            "carrying_capacity":float(rng.uniform(50, 200)), "reproductive_rate":float(rng.uniform(0.1, 0.8))}
+            for i in range(species)]
+    species_effects = [{"type":str(rng.choice(["competition", "predation"], p = [0.8, 0.2])),
+            "from_species":"species_{}".format(source), "on_species":"species_{}".format(target),
+            "intensity":float(rng.uniform(0, 0.2))}
+            for source, target in rng.integers(species, size = (effects, 2)) if source != target]
+    return species_parameters, species_effects
+
+
+def test_sparse_matches_dense():
+    sim = simple_simulation()
+    species_parameters, species_effects = community()
+    sparse = sim.compile(species_parameters, species_effects)
+    dense = sim.compile(species_parameters, species_effects, sparse = False)
+    assert sp.issparse(sparse["A"]) and not sp.issparse(dense["A"])
+    assert np.allclose(sparse["A"].toarray(), dense["A"])
+    assert np.allclose(sim.iterative_run(sparse, 300), sim.iterative_run(dense, 300))
+    assert np.allclose(sim.continuous_run(sparse, 20), sim.continuous_run(dense, 20), rtol = 1e-6)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_streamed_matches_memory(tmp_path, chunk_size):
+    sim = simple_simulation()
+    parameters = sim.compile(*community())
+    expected = sim.iterative_run(parameters, 100)
+    reader = sim.iterative_run(parameters, 100, path = str(tmp_path / "run.npz"), chunk_size = chunk_size)
+    assert isinstance(reader, TrajectoryReader)
+    assert len(reader.chunks["populations"]) == -(-101//chunk_size)
+    assert reader.rows("populations") == 101
+    assert np.array_equal(reader.populations(), expected)
+    assert np.array_equal(reader.final(), expected[-1])
+    assert np.array_equal(reader.populations(["species_3", "species_0"], every = 3), expected[::3, [3, 0]])
+    assert np.array_equal(reader.dataframe(every = 10).index, np.arange(0, 101, 10))
+
+
+def test_streamed_continuous_run(tmp_path):
+    sim = simple_simulation()
+    parameters = sim.compile(*community(species = 10, effects = 20))
+    reader = sim.continuous_run(parameters, 30, path = str(tmp_path / "run.npz"), chunk_size = 8)
+    expected = sim.continuous_run(parameters, 30)
+    assert reader.populations().shape == expected.shape
+    #Restarting the integration at each chunk only changes the adaptive steps
+    assert np.allclose(reader.populations(), expected, rtol = 1e-2, atol = 1e-2)
+
+
+def test_store_buffer(tmp_path):
+    path = str(tmp_path / "store.npz")
+    store = TrajectoryStore(path, ["a", "b"], chunk_size = 4)
+    for step in range(10):
+        store.append([step, -step])
+    assert store.chunks == 2 and store.rows == 2
+    populations = store.reader().populations()
+    assert np.array_equal(populations, np.column_stack([np.arange(10), -np.arange(10)]))
+    with pytest.raises(ValueError):
+        TrajectoryStore(path, ["a"], chunk_size = 0)
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+from lk_refacto import simple_simulation, OUTCOMES
+
+SPECIES = [{"name":"species_1", "initial_pop":10, "carrying_capacity":100, "reproductive_rate":0.5},
+        {"name":"species_2", "initial_pop":10, "carrying_capacity":100, "reproductive_rate":0.5}]
+#Effect of species 2 on species 1 (a12) along the first axis, of species 1 on species 2 (a21) along the second
+RANGES = {("competition", "species_2", "species_1"): [0.2, 0.5, 0.8, 1.2, 1.5, 2.0],
+        ("competition", "species_1", "species_2"): [0.2, 0.5, 0.8, 1.2, 1.5, 2.0]}
+
+
+def expected_outcome(a12, a21):
+    """Outcome of the competition from the isoclines, with equal carrying capacities
+    """
+    if a12 < 1 and a21 < 1:
+        return OUTCOMES.index("coexistence")
+    if a12 < 1:
+        return OUTCOMES.index("exclusion of species 2")
+    return OUTCOMES.index("exclusion of species 1")
+
+
+def test_sweep_matches_isoclines():
+    result = simple_simulation().sweep(RANGES, SPECIES, [], steps = 400)
+    a12, a21 = result["values"]
+    assert result["outcome"].shape == (len(a12), len(a21))
+    for i, first in enumerate(a12):
+        for j, second in enumerate(a21):
+            #Both above 1 the outcome depends on the initial populations
+            if first > 1 and second > 1:
+                continue
+            assert result["outcome"][i, j] == expected_outcome(first, second), (first, second)
+    #Stable coexistence at N* = K(1 - a)/(1 - a12*a21) when both effects are a
+    coexistence = result["final"][1, 1]
+    assert np.allclose(coexistence, 100*(1 - 0.5)/(1 - 0.25), rtol = 1e-3)
+
+
+def test_sweep_cache(tmp_path):
+    sim = simple_simulation()
+    cache_dir = str(tmp_path)
+    first = sim.sweep(RANGES, SPECIES, [], steps = 50, cache_dir = cache_dir)
+    files = os.listdir(cache_dir)
+    assert len(files) == 1 and files[0].endswith(".npz")
+
+    #The same sweep is read back from the cache, not simulated again
+    path = os.path.join(cache_dir, files[0])
+    np.savez(path, outcome = np.full_like(first["outcome"], 3), final = first["final"])
+    cached = sim.sweep(RANGES, SPECIES, [], steps = 50, cache_dir = cache_dir)
+    assert (cached["outcome"] == 3).all()
+    assert cached["keys"] == first["keys"]
+    assert np.array_equal(cached["final"], first["final"])
+
+    #Other settings are another grid
+    other = sim.sweep(RANGES, SPECIES, [], steps = 60, cache_dir = cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    assert not (other["outcome"] == 3).all()